@@ -16,12 +16,32 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see http://www.gnu.org/licenses.
 
+# Modules needed only by some importers or modes (asyncio, multiprocessing,
+# sqlite3, ElementTree, decimal, ...) are imported where they are used to
+# keep startup of one-off conversions fast, see benchmarks/bench_startup.py
+
 import codecs
+import collections
+import contextlib
 import csv
-import argparse
+import functools
+import math
+import io
+import itertools
+import marshal
+import mmap
+import operator
+import os
 import re
-from datetime import date, datetime
-from xml.etree import ElementTree
+import struct
+import sys
+import time
+from array import array
+from datetime import date
+
+
+class ReconciliationError(Exception):
+    pass
 
 
 class BadRecordTypeException(Exception):
@@ -32,74 +52,553 @@ class BadRecordTypeException(Exception):
         return "Bad record type on line: %s" % (self._line_no,)
 
 
-def unicode_csv_reader(unicode_csv_data, dialect=csv.excel, **kwargs):
-    # csv.py doesn't do Unicode; encode temporarily as UTF-8:
-    csv_reader = csv.reader(utf_8_encoder(unicode_csv_data),
-                            dialect=dialect, **kwargs)
-    for row in csv_reader:
-        # decode UTF-8 back to Unicode, cell by cell:
-        # yield [unicode(cell, 'utf-8') for cell in row]
-        yield row
+_quote_deletion = str.maketrans('', '', '"\'')
 
 
-def utf_8_encoder(unicode_csv_data):
-    for line in unicode_csv_data:
-        yield line.encode('utf-8')
+@functools.lru_cache(maxsize=8192)
+def normalize_field(text):
+    """Collapses whitespace and removes quotes from the text
 
+    Counterparties and messages repeat a lot within statements so results
+    are memoized."""
+    return ' '.join(text.split()).translate(_quote_deletion).strip()
 
-def normalize_field(text):
-    ret = re.sub(BankImporter.multispace_re, " ", text)
-    return ret.replace('"', '').replace("'", "").strip()
+
+def normalize_fields(fields):
+    """Normalizes all fields of a row at once"""
+    return list(map(normalize_field, fields))
+
+
+# Decimal comma becomes a point, (non-breaking) spaces separating
+# thousands are dropped
+_num_translation = str.maketrans({',': '.', ' ': None, '\xa0': None})
 
 
 def normalize_num(text):
-    text = text.replace(',', '.').replace(' ', '').strip()
+    """Parses amount like '-1 234,56' into integer minor units (cents)"""
+    text = text.translate(_num_translation).strip()
     if not text:
         return None
 
-    return float(text)
+    sign = 1
+    if text[0] in '+-':
+        if text[0] == '-':
+            sign = -1
+        text = text[1:]
+    whole, _, fraction = text.partition('.')
+    # int() would accept another sign or whitespace
+    if (not (whole or fraction) or (whole and not whole.isdigit()) or
+            (fraction and not fraction.isdigit())):
+        raise ValueError("Invalid amount: %r" % (text,))
+    if len(fraction) > 2:
+        # Rare enough to leave rounding of sub-cent amounts to Decimal
+        from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+        try:
+            value = Decimal(text).scaleb(2).to_integral_value(ROUND_HALF_UP)
+        except InvalidOperation:
+            raise ValueError("Invalid amount: %r" % (text,))
+        return sign * int(value)
+    return sign * (int(whole or '0') * 100 + int(fraction.ljust(2, '0')))
+
+
+def parse_amount(text):
+    """Parses amount of a transaction, which unlike normalize_num() can't
+    be empty"""
+    amount = normalize_num(text)
+    if amount is None:
+        raise ValueError("Missing amount")
+    return amount
+
+
+def format_amount(amount):
+    """Formats integer minor units as a number with two decimal places"""
+    if amount < 0:
+        return '-%d.%02d' % divmod(-amount, 100)
+    return '%d.%02d' % divmod(amount, 100)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(text, order='dmy', separator='.'):
+    """Parses date like '31.12.2014' into date
+
+    order gives the order of day, month and year parts of the text split
+    by separator. Without separator every part has two digits and the
+    year is in 2000s. Statements have few hundred distinct dates in up to
+    hundreds of thousands of rows, so results are memoized. Malformed
+    dates raise ValueError."""
+    if separator:
+        parts = text.split(separator)
+        if len(parts) != 3:
+            raise ValueError("Invalid date: %r" % (text,))
+    else:
+        parts = text[0:2], text[2:4], text[4:6]
+    values = dict(zip(order, map(int, parts)))
+    year = values['y']
+    if not separator:
+        year += 2000
+    return date(year, values['m'], values['d'])
+
+
+def format_date(tdate):
+    """Formats date as YYYY-MM-DD (datetime without the time)"""
+    return '%04d-%02d-%02d' % (tdate.year, tdate.month, tdate.day)
+
+
+def open_input(source):
+    """Returns buffered binary stream reading from source
+
+    source can be a path ('-' stands for stdin), bytes holding the whole
+    statement or an already opened file object."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if hasattr(source, 'read'):
+        if isinstance(source, io.TextIOBase):
+            return source.buffer
+        if isinstance(source, io.BufferedIOBase):
+            return source
+        return io.BufferedReader(source)
+    if source == '-':
+        return sys.stdin.buffer
+    return open(source, 'rb')
+
+
+class Stats(object):
+    """Timers and counters of a conversion
+
+    Time is always credited to the innermost running stage, so times of
+    the stages add up to the total time of the conversion. Nothing is
+    collected unless a Stats object is passed around, the pipeline only
+    checks for None when instrumentation is disabled."""
+
+    # Module level helpers shared by importers and their stages
+    module_stages = (('normalize_field', 'normalize'),
+                     ('normalize_num', 'normalize'),
+                     ('parse_date', 'dates'))
+    # Importer methods and their stages
+    importer_stages = (('get_transaction_data_iterator', 'rows'),
+                       ('compile_extractor', 'fields'))
+
+    def __init__(self):
+        self.times = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.total = 0.0
+        self.profiler = None
+        self._stack = []
+        self._last = None
+
+    def enter(self, stage):
+        now = time.perf_counter()
+        if self._stack:
+            current = self._stack[-1]
+            self.times[current] = self.times.get(current, 0.0) + now - self._last
+        self._stack.append(stage)
+        self._last = now
+
+    def leave(self):
+        now = time.perf_counter()
+        current = self._stack.pop()
+        self.times[current] = self.times.get(current, 0.0) + now - self._last
+        self._last = now
+
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def timed(self, stage, func):
+        """Returns func wrapped to run in stage"""
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            self.enter(stage)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.leave()
+        return timed_func
+
+    def timed_iter(self, stage, iterable, counter=None):
+        """Yields items of iterable, time spent producing them is in stage"""
+        iterator = iter(iterable)
+        while True:
+            self.enter(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.leave()
+            if counter:
+                self.count(counter)
+            yield item
+
+    def instrument(self, importer):
+        """Wraps importer methods and input to record their stages"""
+        for name, stage in self.importer_stages:
+            setattr(importer, name,
+                    self._timed_results(stage, getattr(importer, name)))
+        importer.inputreader = _InstrumentedReader(importer.inputreader,
+                                                   self)
+
+    def _timed_results(self, stage, method):
+        """Wraps method returning iterator or function to time results"""
+        def timed_method(*args):
+            result = method(*args)
+            if callable(result):
+                return self.timed(stage, result)
+            return self.timed_iter(stage, result, stage)
+        return timed_method
+
+    @contextlib.contextmanager
+    def collecting(self, stage='parse'):
+        """Collects stats of everything running in the block
+
+        Module level helpers are replaced by timed versions meanwhile."""
+        module = sys.modules[__name__]
+        saved = {}
+        for name, helper_stage in self.module_stages:
+            saved[name] = getattr(module, name)
+            setattr(module, name, self.timed(helper_stage, saved[name]))
+        if self.profiler:
+            self.profiler.start()
+        start = time.perf_counter()
+        self.enter(stage)
+        try:
+            yield self
+        finally:
+            self.leave()
+            self.total += time.perf_counter() - start
+            if self.profiler:
+                self.profiler.stop()
+            for name, helper in saved.items():
+                setattr(module, name, helper)
+
+    def as_dict(self):
+        result = {
+            'total': self.total,
+            'stages': dict(self.times),
+            'counters': dict(self.counters),
+        }
+        transactions = self.counters.get('transactions', 0)
+        if self.total:
+            result['transactions_per_s'] = transactions / self.total
+            result['mb_per_s'] = (self.counters.get('bytes_read', 0) /
+                                  1e6 / self.total)
+        if self.profiler:
+            result['profile'] = self.profiler.top()
+        return result
+
+    def report(self, out):
+        data = self.as_dict()
+        out.write(u"Total time: %.3fs\n" % data['total'])
+        for stage, seconds in sorted(data['stages'].items(),
+                                     key=lambda item: -item[1]):
+            share = 100.0 * seconds / data['total'] if data['total'] else 0
+            out.write(u"  %-10s %8.3fs %5.1f%%\n" % (stage, seconds, share))
+        for counter, value in data['counters'].items():
+            out.write(u"  %-16s %10d\n" % (counter, value))
+        if 'transactions_per_s' in data:
+            out.write(u"  %.1f transactions/s, %.2f MB/s\n"
+                      % (data['transactions_per_s'], data['mb_per_s']))
+        for location, samples in data.get('profile', []):
+            out.write(u"  %6d  %s\n" % (samples, location))
+
+
+class _InstrumentedInput(io.BufferedIOBase):
+    """Binary input proxy counting bytes and timing reads"""
+    def __init__(self, stream, stats):
+        self._stream = stream
+        self._stats = stats
+
+    def readable(self):
+        return True
+
+    def _timed(self, func, *args):
+        self._stats.enter('read')
+        try:
+            data = func(*args)
+        finally:
+            self._stats.leave()
+        self._stats.count('bytes_read', len(data))
+        return data
+
+    def read(self, size=-1):
+        return self._timed(self._stream.read, size)
+
+    def read1(self, size=-1):
+        return self._timed(getattr(self._stream, 'read1', self._stream.read),
+                           size)
+
+    def close(self):
+        super(_InstrumentedInput, self).close()
+        self._stream.close()
+
+
+class _InstrumentedReader(object):
+    """Text input proxy timing decoding of the input"""
+    def __init__(self, reader, stats):
+        self._reader = reader
+        self._stats = stats
+        self.read = stats.timed('decode', reader.read)
+        self.readline = stats.timed('decode', reader.readline)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._stats.enter('decode')
+        try:
+            return next(self._reader)
+        finally:
+            self._stats.leave()
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+
+class SamplingProfiler(object):
+    """Statistical profiler sampling the running function periodically
+
+    Uses profiling interval timer, so it's available only on Unix. Every
+    sample is passed to hook which by default counts locations."""
+    def __init__(self, interval=0.001, hook=None):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.hook = hook or self.record
+
+    def record(self, frame):
+        code = frame.f_code
+        self.samples["%s:%s (%s)" % (os.path.basename(code.co_filename),
+                                     frame.f_lineno, code.co_name)] += 1
+
+    def _sample(self, signum, frame):
+        if frame is not None:
+            self.hook(frame)
+
+    def start(self):
+        import signal
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        import signal
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def top(self, count=20):
+        return self.samples.most_common(count)
 
 
 IMPORTERS = {}
+# Signatures of registered importers grouped by encoding, see
+# signature_index()
+_signature_index = None
 
 
 def register_importer(source):
     def f(cls):
+        global _signature_index
         assert source not in IMPORTERS, "More importers for the source?"
         IMPORTERS[source] = cls
+        _signature_index = None
         return cls
     return f
 
 
 class SplitItem(object):
+    __slots__ = ('amount', 'message')
+
     def __init__(self, amount, message=None):
-        assert isinstance(amount, float)
-        self.amount = amount  # '$' field
+        if not isinstance(amount, int):
+            raise ValueError("Amount %r isn't in minor units" % (amount,))
+        self.amount = amount  # '$' field, in minor units
         self.message = message  # 'E' field
 
-
 class TransactionData(object):
     """Simple class to hold information about a transaction"""
+    __slots__ = ('date', 'amount', 'destination', 'message', 'ident',
+                 'splits', 'category')
+
     def __init__(self, date=None, amount=None, destination=None, message=None, ident=None):
         self.date = date  # 'D' field
-        self.amount = amount  # 'T' field
+        self.amount = amount  # 'T' field, in minor units
         self.destination = destination  # 'P' field
-        self.message = message.strip()  # 'M' field
+        self.message = message and message.strip()  # 'M' field
         self.ident = ident
         self.splits = []
+        self.category = None  # 'L' field
 
     def add_split(self, split):
         assert isinstance(split, SplitItem)
         self.splits.append(split)
 
     def get_amount(self):
-        """Returns total amount of transaction"""
+        """Returns total amount of transaction in minor units"""
         if self.splits:
             return sum(s.amount for s in self.splits)
         else:
             return self.amount
 
 
+def _intern(text):
+    return text and sys.intern(text)
+
+
+class TransactionBatch(object):
+    """Compact columnar storage for many transactions
+
+    Dates are kept as ordinals and amounts in arrays, strings are
+    interned and splits are stored only for the transactions having
+    them. Items are handed out as TransactionData
+    created on access, so the batch can be passed to write_qif as any
+    other sequence of transactions."""
+
+    def __init__(self, transactions=()):
+        self.dates = array('l')
+        self.amounts = array('q')
+        self.destinations = []
+        self.messages = []
+        self.idents = []
+        self.splits = {}
+        self.extend(transactions)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def append(self, transaction):
+        if transaction.splits:
+            self.splits[len(self.dates)] = tuple(
+                (split.amount, _intern(split.message))
+                for split in transaction.splits)
+        self.dates.append(transaction.date.toordinal())
+        self.amounts.append(transaction.get_amount())
+        self.destinations.append(_intern(transaction.destination))
+        self.messages.append(_intern(transaction.message))
+        self.idents.append(_intern(transaction.ident))
+
+    def extend(self, transactions):
+        append = self.append
+        for transaction in transactions:
+            append(transaction)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.dates)
+        transaction = TransactionData(date.fromordinal(self.dates[index]),
+                                      self.amounts[index],
+                                      destination=self.destinations[index],
+                                      message=self.messages[index],
+                                      ident=self.idents[index])
+        for amount, message in self.splits.get(index, ()):
+            transaction.add_split(SplitItem(amount, message))
+        return transaction
+
+    def __iter__(self):
+        for index in range(len(self.dates)):
+            yield self[index]
+
+    def dumps(self):
+        """Serializes the batch into compact bytes"""
+        return marshal.dumps((self.dates.tobytes(), self.amounts.tobytes(),
+                              self.destinations, self.messages, self.idents,
+                              self.splits))
+
+    @classmethod
+    def loads(cls, data):
+        """Creates batch from bytes returned by dumps
+
+        Raises ValueError if data isn't a serialized batch."""
+        batch = cls()
+        try:
+            (dates, amounts, batch.destinations, batch.messages, batch.idents,
+             batch.splits) = marshal.loads(data)
+            batch.dates.frombytes(dates)
+            batch.amounts.frombytes(amounts)
+            if not (len(batch.dates) == len(batch.amounts) ==
+                    len(batch.destinations) == len(batch.messages) ==
+                    len(batch.idents) and isinstance(batch.splits, dict)):
+                raise ValueError("columns differ")
+        except (EOFError, TypeError, ValueError) as e:
+            raise ValueError("Not a transaction batch: %s" % (e,))
+        return batch
+
+
+# Errors of a single record, the error policy decides whether they stop
+# the conversion
+RECORD_ERRORS = (ValueError, IndexError, KeyError, BadRecordTypeException)
+
+
+class ErrorPolicy(object):
+    """Handling of statement records importers can't convert
+
+    In 'strict' mode the error is raised and the conversion stops, 'skip'
+    reports the record and goes on with the next one, 'quarantine' also
+    writes the raw record preceded by its line number and the error to
+    the quarantine file. Quarantine file is cut to quarantine_size first,
+    which is used when resuming conversion."""
+
+    modes = ('strict', 'skip', 'quarantine')
+
+    def __init__(self, mode='strict', quarantine=None, report=sys.stderr,
+                 stats=None, quarantine_size=0):
+        if mode not in self.modes:
+            raise ValueError("Unknown error policy %r" % (mode,))
+        self.mode = mode
+        self.report = report
+        self.stats = stats
+        self.rejected = 0
+        self.quarantine = None
+        if mode == 'quarantine':
+            if quarantine is None:
+                raise ValueError("Quarantine needs a file")
+            self.quarantine = open_truncated(quarantine, quarantine_size)
+
+    def reject(self, line_no, record, error):
+        if self.mode == 'strict':
+            raise error
+        self.rejected += 1
+        if self.stats is not None:
+            self.stats.count('rejected')
+        where = line_no and "line %d" % line_no or "unknown line"
+        problem = "%s: %s" % (error.__class__.__name__, error)
+        self.report.write(u"Rejected record on %s: %s\n" % (where, problem))
+        if self.quarantine is not None:
+            self.quarantine.write((u"# %s: %s\n%s\n"
+                                   % (where, problem, record.rstrip('\n'))
+                                   ).encode('utf-8'))
+
+    def quarantine_size(self):
+        if self.quarantine is None:
+            return 0
+        self.quarantine.flush()
+        return self.quarantine.tell()
+
+    def close(self):
+        if self.quarantine is not None:
+            empty = not self.quarantine.tell()
+            self.quarantine.close()
+            if empty:
+                os.unlink(self.quarantine.name)
+
+
+def open_truncated(path, size=0):
+    """Opens path for binary writing after its first size bytes"""
+    output = open(path, 'r+b' if size else 'wb')
+    output.truncate(size)
+    output.seek(size)
+    return output
+
+
+def _csv_line(row, delimiter=';'):
+    """Returns row of a CSV statement as text again"""
+    line = io.StringIO()
+    csv.writer(line, delimiter=delimiter).writerow(row)
+    return line.getvalue()
+
+
+class _IdentityColumns(dict):
+    """Column mapping for rows which are dictionaries already"""
+    def __missing__(self, key):
+        return key
+
+
 class BankImporter(object):
     """Base class for statement import
 
@@ -107,83 +606,239 @@ class BankImporter(object):
     Maybe the easiest way is to call yield ever time
     you have new TransactionData."""
 
-    multispace_re = re.compile('\s+')
     input_encoding = "utf-8"
+    # Separator of day, month and year in the date column
+    date_separator = '-'
+    # Increase when the importer starts producing different transactions
+    # from the same input, cached results are invalidated then
+    version = 1
     headline_start = None
     field_translation = {}
+    # Lines outside the data like "#Konečný zůstatek:;1 000,00 CZK;" and
+    # attributes to store their amounts to
+    summary_lines = {}
+    # Balances stated in the statement in minor units, set by importers
+    # when they find them
+    opening_balance = None
+    closing_balance = None
+    # ISO 4217 code of the currency of the account
+    currency = 'CZK'
+    # Number of the statement read now when more statements can be
+    # concatenated in one input, their balances are set as each starts
+    statement_no = 0
+    # Regular expression (in multiline mode) found in the beginning of
+    # statements of this type, used for automatic detection. Defaults to
+    # line starting with headline_start
+    signature = None
+    # Line of the input last read by the line based readers
+    line_no = None
+    # Position of the record last read in the input, its line (row of
+    # mBank HTML) number, and position up to which records are skipped
+    # without converting them when conversion resumes from a checkpoint
+    position = 0
+    resume_position = 0
+
+    @classmethod
+    def get_signature(cls):
+        if cls.signature is not None:
+            return cls.signature
+        if cls.headline_start is not None:
+            return '^' + re.escape(cls.headline_start)
+        return None
 
-    def __init__(self, infile):
-        reader = codecs.getreader(self.input_encoding)
-        self.inputreader = reader(open(infile, 'r'))
+    def __init__(self, infile, stats=None, errors=None):
+        # Input is opened just once and decoded with input_encoding,
+        # importers should read only from inputreader
         self.infile = infile
+        self.errors = errors
+        self.input = open_input(infile)
+        if stats is not None:
+            self.input = _InstrumentedInput(self.input, stats)
+        self.inputreader = io.TextIOWrapper(self.input,
+                                            encoding=self.input_encoding)
+        if stats is not None:
+            stats.instrument(self)
+
+    def reject(self, line_no, record, error):
+        """Hands over raw record which can't be converted to error policy
+
+        Without a policy the error is raised again, so importers call this
+        from their except clause for RECORD_ERRORS and skip the record."""
+        if line_no is not None and line_no <= self.resume_position:
+            # Rejected before the checkpoint already
+            return
+        if self.errors is None:
+            raise error
+        self.errors.reject(line_no, record, error)
+
+    def raw_record(self, row):
+        """Returns data row as text for the quarantine"""
+        return _csv_line(row)
 
     def get_transaction_data_iterator(self):
-        file_iterator = self.dirty_csv_iterator(self.infile)
-        return csv.DictReader(file_iterator, delimiter=';', dialect=csv.excel)
+        """Yields data rows of the statement
+
+        Rows are lists, columns maps translated names from the header to
+        indices in them."""
+        file_iterator = self.dirty_csv_iterator(self.inputreader)
+        reader = csv.reader(file_iterator, delimiter=';', dialect=csv.excel)
+        header = next(reader, None)
+        if header is None:
+            return
+        self.columns = dict((name, index) for index, name in enumerate(header))
+        for row in reader:
+            if row:
+                yield row
+
+    def csv_rows(self, delimiter=';'):
+        """Returns reader of CSV rows (lists) of the input
+
+        Input is decoded just once by inputreader, positional importers
+        pick their columns from the rows with itemgetter."""
+        return csv.reader(self.inputreader, delimiter=delimiter)
+
+    def map_input(self):
+        """Returns (buffer, offset) with the rest of the input
+
+        Regular files are memory-mapped, so reading them costs only page
+        cache, other inputs are read whole into bytes."""
+        stream = self.input
+        stats = None
+        if isinstance(stream, _InstrumentedInput):
+            stream, stats = stream._stream, stream._stats
+        try:
+            offset = stream.tell()
+            buffer = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            # Empty files can't be mapped either
+            buffer, offset = self.input.read(), 0
+        else:
+            if stats is not None:
+                stats.count('bytes_read', len(buffer) - offset)
+        return buffer, offset
+
+    def compile_extractor(self, columns):
+        """Returns function extracting data of transaction from a row
+
+        The function returns (date, amount, transaction type, message,
+        counterparty and its account) with all but date raw strings.
+        Columns are resolved just once, importers customize the extraction
+        by wrapping the function returned here."""
+        get = operator.itemgetter(columns['date'], columns['amount'],
+                                  columns['trans_type'], columns['message'],
+                                  columns['from/to'], columns['recipient'])
+        date_separator = self.date_separator
+
+        def extract(row):
+            tdate, amount, trans_type, message, target, acc = get(row)
+            return (parse_date(tdate, 'dmy', date_separator), amount,
+                    trans_type, message, target, acc)
+        return extract
 
     def __iter__(self):
+        extract = None
+        resume = self.resume_position
         for row in self.get_transaction_data_iterator():
+            self.position = self.line_no
+            if self.position <= resume:
+                continue
+            if extract is None:
+                extract = self.compile_extractor(self.columns)
+
+            try:
+                (tdate, amount, trans_type, trans_desc, trans_target,
+                 trans_acc) = extract(row)
+                tamount = parse_amount(amount)
+            except RECORD_ERRORS as e:
+                self.reject(self.line_no, self.raw_record(row), e)
+                continue
 
-            d, m, y = self.get_dmy(row)
-
-            tdate = date(int(y), int(m), int(d))
-            tamount = float(normalize_num(self.get_amount(row)))
-
-            trans_type = normalize_field(self.get_trans_type(row))
-            trans_desc = normalize_field(self.get_message(row))
-            trans_target = normalize_field(self.get_from_to(row))
-            trans_acc = normalize_field(self.get_acc(row))
+            trans_type, trans_desc, trans_target, trans_acc = \
+                normalize_fields((trans_type, trans_desc, trans_target,
+                                  trans_acc))
 
             tmessage = u"%s %s %s %s" % (trans_type, trans_desc, trans_target, trans_acc)
             tmessage = tmessage.strip()
 
             # The following is specific for KB
             if not tmessage:
-                tmessage = normalize_field(row['Popis příkazce'])
+                try:
+                    tmessage = normalize_field(
+                        row[self.columns['Popis příkazce']])
+                except RECORD_ERRORS as e:
+                    self.reject(self.line_no, self.raw_record(row), e)
+                    continue
 
             yield TransactionData(tdate, tamount, message=tmessage)
 
-    def get_dmy(self, row):
-        d, m, y = row['date'].split('-')
-        return d, m, y
-
-    def get_amount(self, row):
-        return row['amount']
-
-    def get_trans_type(self, row):
-        return row['trans_type']
-
-    def get_message(self, row):
-        return row['message']
-
-    def get_from_to(self, row):
-        return row['from/to']
-
-    def get_acc(self, row):
-        return row['recipient']
-
-    def dirty_csv_iterator(self, file):
+    def dirty_csv_iterator(self, lines):
 
         headline_start = self.headline_start
         field_translation = self.field_translation
 
-        with open(file, "rt", encoding="cp1250") as theFile:
-            processing_data = False
-            for line in theFile:
-
-                if line.startswith(headline_start):
-                    # TODO use CSV?
-                    headline_items = line.rstrip('\n').split(';')
-                    translated_headline = [field_translation.get(h, h) for h in headline_items]
-                    line = ';'.join(translated_headline)
-                    processing_data = True
-
-                if processing_data:
-                    line = line.rstrip('\n')
-                    if len(line) == 0:
-                        raise StopIteration
-                    else:
-                        yield line
+        summary_lines = self.summary_lines
+        processing_data = False
+        for self.line_no, line in enumerate(lines, 1):
+
+            if line.startswith(headline_start):
+                # TODO use CSV?
+                headline_items = line.rstrip('\n').split(';')
+                translated_headline = [field_translation.get(h, h) for h in headline_items]
+                line = ';'.join(translated_headline)
+                processing_data = True
+
+            if processing_data:
+                line = line.rstrip('\n')
+                if len(line) == 0:
+                    break
+                else:
+                    yield line
+            elif summary_lines:
+                self.read_summary_line(line)
+        # Summary like the closing balance can follow the data
+        if summary_lines:
+            for line in lines:
+                self.read_summary_line(line)
+
+    def read_summary_line(self, line):
+        name, _, rest = line.partition(';')
+        attribute = self.summary_lines.get(name)
+        if attribute is not None:
+            # Amount is followed by currency code
+            amount = rest.split(';', 1)[0].rstrip(' ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+            setattr(self, attribute, normalize_num(amount))
+
+    @classmethod
+    def split_records(cls, data):
+        """Splits raw statement into context and records
+
+        Returns (prefix, records) where prefix followed by any consecutive
+        records is a statement on its own, or None if statement can't be
+        split. By default prefix ends with headline and records are lines
+        until the first empty one.
+        """
+        lines = data.splitlines(True)
+        start = 0
+        if cls.headline_start is not None:
+            headline = cls.headline_start.encode(cls.input_encoding)
+            for start, line in enumerate(lines, 1):
+                if line.startswith(headline):
+                    break
+            else:
+                return None
+        records = []
+        pending = b''
+        for line in lines[start:]:
+            if not pending and not line.strip():
+                break
+            pending += line
+            # Quoted value can span more lines
+            if pending.count(b'"') % 2 == 0:
+                records.append(pending)
+                pending = b''
+        if pending:
+            records.append(pending)
+        return b''.join(lines[:start]), records
 
 
 @register_importer("mbank")
@@ -198,24 +853,26 @@ class MBankImport(BankImporter):
         "#Plátce/Příjemce": 'from/to',
         "#Číslo účtu plátce/příjemce": 'recipient',
     }
+    summary_lines = {
+        '#Počáteční zůstatek:': 'opening_balance',
+        '#Konečný zůstatek:': 'closing_balance',
+    }
 
-    @staticmethod
-    def _description_regex(desc_field):
-        return re.match(r"(.+)\s+DATUM PROVEDENÍ TRANSAKCE: (\d{4})-(\d{2})-(\d{2})", desc_field)
+    description_re = re.compile(r"(.+)\s+DATUM PROVEDENÍ TRANSAKCE: (\d{4}-\d{2}-\d{2})")
 
-    def get_message(self, row):
-        matches = self._description_regex(row['message'])
-        if matches:
-            return matches.group(1)
-        else:
-            return row['message']
+    def compile_extractor(self, columns):
+        extract = super(MBankImport, self).compile_extractor(columns)
+        match_description = self.description_re.match
 
-    def get_dmy(self, row):
-        matches = self._description_regex(row['message'])
-        if matches:
-            return matches.group(4), matches.group(3), matches.group(2)
-        else:
-            return row['date'].split('-')
+        def mbank_extract(row):
+            tdate, amount, trans_type, message, target, acc = extract(row)
+            # Card payments have the actual date in the message
+            matches = match_description(message)
+            if matches:
+                message = matches.group(1)
+                tdate = parse_date(matches.group(2), 'ymd', '-')
+            return tdate, amount, trans_type, message, target, acc
+        return mbank_extract
 
 
 @register_importer("airbank")
@@ -231,9 +888,8 @@ class AirBankImport(BankImporter):
         '"Název účtu protistrany"': 'from/to',
         '"Číslo účtu protistrany"': 'recipient',
     }
+    date_separator = '/'
 
-    def get_dmy(self, row):
-        return row['date'].split('/')
 
 @register_importer("kb")
 class KBImport(BankImporter):
@@ -247,21 +903,25 @@ class KBImport(BankImporter):
         '"AV pole 3"': 'from/to',
         '"Název protiúčtu"': 'recipient',
     }
-
-    def get_dmy(self, row):
-        # Extract date and the actual description from the "description" field
-        matches = re.match(r"(\d{2}).(\d{2}).(\d{4})\s+\d+,\d{2} CZ", normalize_field(row['AV pole 4']))
-        if matches:
-            return matches.group(1), matches.group(2), matches.group(3)
-        else:
-            return row['date'].split('.')
-
-    def get_acc(self, row):
-        trans_acc = normalize_field(row['recipient'])
-        if trans_acc == 'PLATEBNÍ KARTY EC/MC CZK':
-            return ''
-        else:
-            return trans_acc
+    date_separator = '.'
+    card_date_re = re.compile(r"(\d{2}).(\d{2}).(\d{4})\s+\d+,\d{2} CZ")
+
+    def compile_extractor(self, columns):
+        extract = super(KBImport, self).compile_extractor(columns)
+        get_card_info = operator.itemgetter(columns['AV pole 4'])
+        match_card_date = self.card_date_re.match
+
+        def kb_extract(row):
+            tdate, amount, trans_type, message, target, acc = extract(row)
+            # Extract date and the actual description from the "description" field
+            matches = match_card_date(normalize_field(get_card_info(row)))
+            if matches:
+                tdate = parse_date('%s.%s.%s' % matches.groups())
+            acc = normalize_field(acc)
+            if acc == 'PLATEBNÍ KARTY EC/MC CZK':
+                acc = ''
+            return tdate, amount, trans_type, message, target, acc
+        return kb_extract
 
 
 @register_importer("csob")
@@ -276,196 +936,373 @@ class CsobImport(BankImporter):
         'název protiúčtu': 'from/to',
         'protiúčet': 'recipient',
     }
+    date_separator = '.'
 
-    def get_dmy(self, row):
-        d, m, y = row['date'].split('.')
-        return d, m, y
+    def raw_record(self, row):
+        return u"".join(u"%s: %s\n" % item for item in row.items())
 
     def get_transaction_data_iterator(self):
-        return self.dirty_line_iterator(self.infile)
+        # Rows are dictionaries, so the columns are their keys
+        self.columns = _IdentityColumns()
+        return self.dirty_line_iterator(self.inputreader)
 
-    def dirty_line_iterator(self, file):
+    def dirty_line_iterator(self, lines):
 
         headline_start = self.headline_start
         field_translation = self.field_translation
 
-        with open(file, "rt") as theFile:
-            transaction_data = None
-            for line in theFile:
-
-                # Initialize transaction data on the first valid line
-                if line.startswith(headline_start):
-                    transaction_data = {}
-
-                if transaction_data is not None:
-                    # Return the transaction on next blank line
-                    if re.match(r'^\s+$', line):
-                        yield transaction_data
+        transaction_data = None
+        for self.line_no, line in enumerate(lines, 1):
+
+            # Initialize transaction data on the first valid line
+            if line.startswith(headline_start):
+                transaction_data = {}
+
+            if transaction_data is not None:
+                # Return the transaction on next blank line
+                if line.isspace():
+                    yield transaction_data
+                    transaction_data = None
+                # Capture transaction info
+                else:
+                    kv_pair = line.rstrip('\n').split(':')
+                    if len(kv_pair) < 2:
+                        # Rest of the block up to the next headline is
+                        # dropped with the record
                         transaction_data = None
-                    # Capture transaction info
-                    else:
-                        kv_pair = line.rstrip('\n').split(':')
-                        key = kv_pair[0].strip()
-                        value = kv_pair[1].strip()
-                        translated_key = field_translation.get(key, key)
-                        transaction_data[translated_key] = value
+                        self.reject(self.line_no, line,
+                                    ValueError("Line without value"))
+                        continue
+                    key = kv_pair[0].strip()
+                    value = kv_pair[1].strip()
+                    translated_key = field_translation.get(key, key)
+                    transaction_data[translated_key] = value
+
+    @classmethod
+    def split_records(cls, data):
+        # Records are blocks of lines starting with headline and ending
+        # with blank line
+        headline = cls.headline_start.encode(cls.input_encoding)
+        records = []
+        block = None
+        for line in data.splitlines(True):
+            if line.startswith(headline):
+                block = []
+            if block is not None:
+                block.append(line)
+                if line.isspace():
+                    records.append(b''.join(block))
+                    block = None
+        if block:
+            records.append(b''.join(block))
+        return b'', records
+
+
+def _plain_content_parts(element):
+    for child in element:
+        yield child.text or ''
+        if len(child):
+            yield plain_content(child)
+        else:
+            yield ''
+        yield child.tail or ''
 
 
 def plain_content(element):
-    output = []
-    for child in element:
-        output.append(child.text or '')
-        output.append(plain_content(child))
-        output.append(child.tail or '')
-    return ' '.join(output)
+    return ' '.join(_plain_content_parts(element))
 
 
 @register_importer("mbank-html")
 class MBankHTMLImport(BankImporter):
     """
     Convert mBank HTML statements send by e-mail.
+
+    The statement is parsed incrementally and transactions are yielded as
+    soon as their row of the statement table is closed. Processed rows are
+    dropped from the tree so memory use doesn't grow with statement size.
     """
     input_encoding = 'iso-8859-2'
+    signature = r'(?is)<html.*?mbank'
+    # Index of the statement table among all tables in the document
+    statement_table = 5
+    chunk_size = 1 << 16
+
+    @classmethod
+    def split_records(cls, data):
+        return None
+
+    def iter_rows(self):
+        """Yields the rows of statement table except the first two and last"""
+        from xml.etree import ElementTree
+        parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        tables = 0
+        table = None
+        depth = 0
+        skip = 2
+        pending = None
+        while True:
+            chunk = self.inputreader.read(self.chunk_size)
+            if chunk:
+                parser.feed(chunk)
+            else:
+                parser.close()
+            for event, element in parser.read_events():
+                if table is None:
+                    if event == 'start' and element.tag == 'table':
+                        if tables == self.statement_table:
+                            table = element
+                        tables += 1
+                    continue
+                if element is table:
+                    # The last row is not a transaction
+                    return
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth:
+                    continue
+                # Direct child of the statement table is complete
+                if skip:
+                    skip -= 1
+                    table.remove(element)
+                    continue
+                if pending is not None:
+                    yield pending
+                    table.remove(pending)
+                pending = element
+            if not chunk:
+                raise IndexError("Statement table not found")
 
     def __iter__(self):
-        root = ElementTree.fromstringlist(codecs.iterencode(self.inputreader, 'utf'))
-        table = root.findall('.//table')[5]
-        for row in table[2:-1]:
-            date_str = row.find('.//td[3].nobr').text
-            tdate = datetime.strptime(date_str, '%d.%m.%Y')
-            amount_str = row.find('.//td[5].nobr').text
-            amount_str = amount_str.replace('.', '')
-            tamount = float(normalize_num(amount_str))
-            desc = plain_content(row.find('.//td[4]'))
+        resume = self.resume_position
+        for self.position, row in enumerate(self.iter_rows(), 1):
+            if self.position <= resume:
+                continue
+            try:
+                date_str = row.find('.//td[3].nobr').text
+                tdate = parse_date(date_str)
+                amount_str = row.find('.//td[5].nobr').text
+                amount_str = amount_str.replace('.', '')
+                tamount = parse_amount(amount_str)
+                desc = plain_content(row.find('.//td[4]'))
+            except (AttributeError, TypeError) + RECORD_ERRORS as e:
+                # Missing cells make find() return None
+                from xml.etree import ElementTree
+                self.reject(None, ElementTree.tostring(row, 'unicode'), e)
+                continue
             tmessage = normalize_field(desc)
             yield TransactionData(tdate, tamount, message=tmessage)
 
 
 @register_importer("unicredit")
 class UnicreditImport(BankImporter):
+    headline_start = "Účet"
+    signature = r'^"?Účet"?;'
+
+    # Amount, date, bank code, bank name (two columns), account number,
+    # account name and transaction details (six columns)
+    used_columns = (1, 3, 5, 6, 7, 8, 9, 13, 14, 15, 16, 17, 18)
+
     def __iter__(self):
-        items = False
-        for row in unicode_csv_reader(self.inputreader, delimiter=';'):
-            if not items and len(row) > 0 and row[0] == u"Účet":
-                items = True
+        get = operator.itemgetter(*self.used_columns)
+        resume = self.resume_position
+        rows = self.csv_rows()
+        for row in rows:
+            if len(row) > 0 and row[0] == u"Účet":
+                break
+        for row in rows:
+            if len(row) == 0:
+                break
+            self.position = rows.line_num
+            if self.position <= resume:
                 continue
-            if items:
-                if len(row) == 0:
-                    break
-                y, m, d = row[3].split('-')
-                tdate = date(int(y), int(m), int(d))
-                tamount = float(normalize_num(row[1]))
-                bank_no = row[5]
-                bank_name = "%s %s" % (normalize_field(row[6]),
-                                       normalize_field(row[7]))
-                bank_name = bank_name.strip()
-                account_number = normalize_field(row[8])
-                account_name = normalize_field(row[9])
-                tdest = None
-                if account_number != "":
-                    tdest = "%s: %s/%s %s" % (bank_name,
-                                              account_number,
-                                              bank_no,
-                                              account_name)
-
-                t_type = row[13].strip()
-                if t_type == u"PLATBA PLATEBNÍ KARTOU" and \
-                        tdest is None:
-                    # when paid by card the description of place is in
-                    # last of "transaction details"
-                    for i in reversed(range(13, 19)):
-                        if normalize_field(row[i]) != "":
-                            tdest = "%s" % (normalize_field(row[i]))
-                            break
-
-                tmessage = "%s %s %s %s %s %s" % (row[13],
-                                                  row[14],
-                                                  row[15],
-                                                  row[16],
-                                                  row[17],
-                                                  row[18])
-                tmessage = normalize_field(tmessage)
-                yield TransactionData(tdate, tamount, message=tmessage,
-                                      destination=tdest)
+            try:
+                values = get(row)
+                (amount, tdate, bank_no, bank_name, bank_name2,
+                 account_number, account_name) = values[:7]
+                details = values[7:]
+                tdate = parse_date(tdate, 'ymd', '-')
+                tamount = parse_amount(amount)
+            except RECORD_ERRORS as e:
+                self.reject(rows.line_num, _csv_line(row), e)
+                continue
+            bank_name = "%s %s" % (normalize_field(bank_name),
+                                   normalize_field(bank_name2))
+            bank_name = bank_name.strip()
+            account_number = normalize_field(account_number)
+            account_name = normalize_field(account_name)
+            tdest = None
+            if account_number != "":
+                tdest = "%s: %s/%s %s" % (bank_name,
+                                          account_number,
+                                          bank_no,
+                                          account_name)
+
+            t_type = details[0].strip()
+            if t_type == u"PLATBA PLATEBNÍ KARTOU" and \
+                    tdest is None:
+                # when paid by card the description of place is in
+                # last of "transaction details"
+                for detail in reversed(details):
+                    if normalize_field(detail) != "":
+                        tdest = "%s" % (normalize_field(detail))
+                        break
+
+            tmessage = "%s %s %s %s %s %s" % details
+            tmessage = normalize_field(tmessage)
+            yield TransactionData(tdate, tamount, message=tmessage,
+                                  destination=tdest)
 
 
 @register_importer("zuno")
 class ZunoImport(BankImporter):
+    currency = 'EUR'
+    headline_start = "Dátum transakcie:"
+    signature = r'^"?Dátum transakcie:"?;'
+    # Date, account number, bank code, message and amount
+    used_columns = (0, 3, 4, 5, 6)
+
     def __iter__(self):
-        items = False
-        for row in unicode_csv_reader(self.inputreader, delimiter=';'):
-            if not items and len(row) > 0 and row[0] == u"Dátum transakcie:":
-                items = True
+        get = operator.itemgetter(*self.used_columns)
+        resume = self.resume_position
+        rows = self.csv_rows()
+        for row in rows:
+            if len(row) > 0 and row[0] == u"Dátum transakcie:":
+                break
+        for row in rows:
+            if len(row) <= 1:
+                break
+            self.position = rows.line_num
+            if self.position <= resume:
                 continue
-            if items:
-                if len(row) <= 1:
-                    break
 
-                d, m, y = row[0].split('.')
-                tdate = date(int(y), int(m), int(d))
-                tamount = float(normalize_num(row[6]))
+            try:
+                tdate, account_number, bank_code, message, amount = get(row)
+                tdate = parse_date(tdate)
+                tamount = parse_amount(amount)
+            except RECORD_ERRORS as e:
+                self.reject(rows.line_num, _csv_line(row), e)
+                continue
 
-                account_number = normalize_field(row[3])
-                bank_code = normalize_field(row[4])
-                tdest = None
+            account_number = normalize_field(account_number)
+            bank_code = normalize_field(bank_code)
+            tdest = None
 
-                if account_number != "":
-                    tdest = "%s/%s" % (account_number, bank_code)
-                    tdest = tdest.strip()
+            if account_number != "":
+                tdest = "%s/%s" % (account_number, bank_code)
+                tdest = tdest.strip()
 
-                tmessage = normalize_field(row[5])
-                yield TransactionData(tdate, tamount, message=tmessage,
-                                      destination=tdest)
+            tmessage = normalize_field(message)
+            yield TransactionData(tdate, tamount, message=tmessage,
+                                  destination=tdest)
 
 
 @register_importer("fio")
 class FioImport(BankImporter):
+    """
+    Convert Fio statements in GPC (ABO) format.
+
+    GPC is fixed-width, so records are sliced from memory-mapped input
+    and split into fields with a precompiled struct. Only fields needed
+    for the output are decoded. Several statements (each starting
+    with 074 record) can be concatenated in one file.
+    """
     input_encoding = "cp1250"
+    signature = r'\A074'
+    # Layout of the 075 (transaction) record
+    transaction_record = struct.Struct('3s16s16s13s12s1s10s10s10s6s20s5s6s')
+    # Old and new balance in the 074 (account) record, each followed by sign
+    account_balances = struct.Struct('45x14s1s14s1s')
+
+    @classmethod
+    def split_records(cls, data):
+        # Account info from the first line is the context, concatenated
+        # statements have more 074 records among the transactions
+        lines = data.splitlines(True)
+        if not lines:
+            return None
+        return lines[0], lines[1:]
+
+    def read_balances(self, buffer, pos):
+        # Every concatenated statement (possibly of another account) has
+        # its own balances
+        opening, opening_sign, closing, closing_sign = \
+            self.account_balances.unpack_from(buffer, pos)
+        self.statement_no += 1
+        self.opening_balance = int(opening)
+        if opening_sign == b'-':
+            self.opening_balance = -self.opening_balance
+        self.closing_balance = int(closing)
+        if closing_sign == b'-':
+            self.closing_balance = -self.closing_balance
 
     def __iter__(self):
         # For GPC format documentation see here:
         # http://www.fio.cz/docs/cz/struktura-gpc.pdf
-        line_no = 1
-
-        # The first line contains info about account
-        line = self.inputreader.readline()
-        record_type = line[0:3]
-        if record_type != '074':
-            raise BadRecordTypeException(line_no)
-
-        # The following lines contain transactions
-        for line in self.inputreader:
+        unpack = self.transaction_record.unpack_from
+        record_size = self.transaction_record.size
+        encoding = self.input_encoding
+
+        buffer, pos = self.map_input()
+        size = len(buffer)
+        find = buffer.find
+        resume = self.resume_position
+        line_no = 0
+        while pos < size:
             line_no += 1
-            # Record type must be '075' (transaction)
-            record_type = line[0:3]
-            if record_type != '075':
-                raise BadRecordTypeException(line_no)
-
-            # Transaction type; 1 = debet, 2 = credit, 4 = storno of debet,
-            # 5 = storno of credit
-            ttype = int(line[60])
-
-            # Transaction amount
-            tamount = float(line[48:60]) / 100.0
-            if ttype in (1, 5):
-                tamount = -tamount
-
-            # Transaction date (DDMMYY)
-            d = int(line[122:124])
-            m = int(line[124:126])
-            y = 2000 + int(line[126:128])
-            tdate = date(y, m, d)
-
-            # Destination account
-            tbankcode = line[71:81].lstrip('0')[0:4]
-            tdestacc = line[19:35].lstrip('0')
-            tdest = tdestacc and ('%s/%s' % (tdestacc, tbankcode)) or None
-
-            # Message
-            tmessage = line[97:117].strip()
+            end = find(b'\n', pos)
+            if end < 0:
+                end = size
+            record_type = buffer[pos:pos + 3]
+            # The first line contains info about account, more statements
+            # may follow each starting with such a line
+            if record_type == b'074':
+                if end - pos >= self.account_balances.size:
+                    self.read_balances(buffer, pos)
+                pos = end + 1
+                continue
+            start = pos
+            pos = end + 1
+            if line_no <= resume:
+                continue
+            self.position = line_no
+            try:
+                # Other records must be '075' (transaction)
+                if (record_type != b'075' or line_no == 1 or
+                        end - start < record_size):
+                    raise BadRecordTypeException(line_no)
+
+                (_, _, destacc, ident, amount, ttype, _, bankcode, _, _,
+                 message, _, tdate) = unpack(buffer, start)
+
+                # Transaction type; 1 = debet, 2 = credit, 4 = storno of
+                # debet, 5 = storno of credit
+                ttype = int(ttype)
+
+                # Transaction amount
+                tamount = int(amount)
+                if ttype in (1, 5):
+                    tamount = -tamount
+
+                # Transaction date (DDMMYY)
+                tdate = parse_date(tdate, 'dmy', '')
+
+                # Destination account
+                tbankcode = bankcode.lstrip(b'0')[0:4].decode(encoding)
+                tdestacc = destacc.lstrip(b'0').decode(encoding)
+
+                # Message
+                tmessage = message.decode(encoding).strip()
+
+                # Transaction identifier
+                tident = ident.decode(encoding)
+            except RECORD_ERRORS as e:
+                self.reject(line_no,
+                            buffer[start:end].decode(encoding, 'replace'), e)
+                continue
 
-            # Transaction identifier
-            tident = line[35:48]
+            tdest = tdestacc and ('%s/%s' % (tdestacc, tbankcode)) or None
 
             # Append transaction to the list
             yield TransactionData(tdate, tamount, destination=tdest,
@@ -482,43 +1319,127 @@ class RaiffeisenBankImport(BankImporter):
     header_delimiter = '=' * 86
     # Delimiter between the rows
     row_delimiter = '-' * 86
+    signature = r'^\s*={86}\s*$'
+    # Patterns of whole raw rows
+    header_delimiter_re = re.compile(br'\s*={86}\s*\Z')
+    row_delimiter_re = re.compile(br'\s*-{86}\s*\Z')
     # Period line pattern
     period_re = re.compile(r'Za období \d+\.\d+\.(?P<year>\d+)', re.UNICODE)
 
-    def __iter__(self):
+    @classmethod
+    def split_records(cls, data):
+        # Header with the year is the context, records end with row
+        # delimiter
+        header_delimiter = cls.header_delimiter.encode(cls.input_encoding)
+        row_delimiter = cls.row_delimiter.encode(cls.input_encoding)
+        lines = data.splitlines(True)
+        delim_counter = 5
+        for start, line in enumerate(lines, 1):
+            if line.strip() == header_delimiter:
+                delim_counter -= 1
+                if not delim_counter:
+                    break
+        else:
+            return None
+        records = []
+        record = []
+        for line in lines[start:]:
+            record.append(line)
+            if line.strip() == row_delimiter:
+                records.append(b''.join(record))
+                record = []
+        if record:
+            records.append(b''.join(record))
+        return b''.join(lines[:start]), records
+
+    def iter_records(self):
+        """Yields year of the statement and then (line number, text) of
+        every record
+
+        Header and record boundaries are found in the raw memory-mapped
+        input, each record is decoded in one go."""
+        encoding = self.input_encoding
+        buffer, pos = self.map_input()
+        size = len(buffer)
+        find = buffer.find
+        header_delimiter_match = self.header_delimiter_re.match
         year = None
         delim_counter = 5
-        while delim_counter:
-            row = next(self.inputreader)
-            if row.strip() == self.header_delimiter:
+        line_no = 0
+        while delim_counter and pos < size:
+            line_no += 1
+            end = find(b'\n', pos)
+            if end < 0:
+                end = size
+            if header_delimiter_match(buffer, pos, end):
                 delim_counter -= 1
-            match = self.period_re.match(row)
-            if match:
-                year = match.group('year')
+            else:
+                match = self.period_re.match(buffer[pos:end].decode(encoding))
+                if match:
+                    year = match.group('year')
+            pos = end + 1
 
         if not year:
             raise ValueError('Year not found.')
+        yield year
+
+        row_delimiter = self.row_delimiter.encode(encoding)
+        row_delimiter_match = self.row_delimiter_re.match
+        resume = self.resume_position
+        start = pos
+        while pos < size:
+            found = find(row_delimiter, pos)
+            if found < 0:
+                break
+            line_start = buffer.rfind(b'\n', 0, found) + 1
+            line_end = find(b'\n', found)
+            if line_end < 0:
+                line_end = size
+            pos = line_end + 1
+            # Dashes can appear in the middle of a row, too
+            if row_delimiter_match(buffer, line_start, line_end):
+                record = buffer[start:line_start]
+                # Records before the checkpoint aren't even decoded
+                if line_no + 1 > resume:
+                    try:
+                        text = record.decode(encoding)
+                    except UnicodeDecodeError as e:
+                        self.reject(line_no + 1,
+                                    record.decode(encoding, 'replace'), e)
+                    else:
+                        yield line_no + 1, text
+                # Lines of the record and the delimiter
+                line_no += record.count(b'\n') + 1
+                start = pos
+
+    def __iter__(self):
+        records = self.iter_records()
+        year = next(records)
+        for self.position, record in records:
+            try:
+                transaction = self.parse_record(record, year)
+            except RECORD_ERRORS as e:
+                self.reject(self.position, record, e)
+                continue
+            yield transaction
 
+    def parse_record(self, record, year):
+        """Returns transaction from text of one record (rows of table)"""
         transaction = TransactionData()
         row_count = 0
-        for row in self.inputreader:
+        for row in record.split('\n'):
             if row.strip() == '':
                 continue
 
             row_count += 1
-            if row.strip() == self.row_delimiter:
-                # We found delimiter, push the record and start a new one
-                yield transaction
-                transaction = TransactionData()
-                row_count = 0
-                continue
             if row_count == 1:
-                transaction.date = datetime.strptime('%s%s' % (row[5:11], year), '%d.%m.%Y')
+                transaction.date = parse_date(row[5:11] + year)
                 message = row[11:33].strip()
                 if message:
                     transaction.message = message
                 # Main item
-                transaction.add_split(SplitItem(normalize_num(row[55:76]), message))
+                transaction.add_split(SplitItem(parse_amount(row[55:76]),
+                                                message))
                 # Transaction fee
                 fee = normalize_num(row[77:86])
                 if fee:
@@ -537,24 +1458,41 @@ class RaiffeisenBankImport(BankImporter):
                 message = transaction.message or ''
                 message += row.strip()
                 transaction.message = message
+        return transaction
 
 
 @register_importer("slsp")
 class SlSpImport(BankImporter):
     input_encoding = "cp1250"
+    currency = 'EUR'
+    # Date, prepended number, account number, bank code, amount, account
+    # name, name, information and extended information (two columns)
+    used_columns = (0, 3, 4, 5, 7, 6, 11, 16, 18, 22)
 
     def __iter__(self):
-        for row in unicode_csv_reader(self.inputreader, delimiter=';'):
+        get = operator.itemgetter(*self.used_columns)
+        resume = self.resume_position
+        rows = self.csv_rows()
+        for row in rows:
             if len(row) <= 1:
                 break
+            self.position = rows.line_num
+            if self.position <= resume:
+                continue
 
-            d, m, y = row[0].split('.')
-            tdate = date(int(y), int(m), int(d))
-            tamount = float(normalize_num(row[7]))
+            try:
+                (tdate, prepend_number, account_number, bank_code, amount,
+                 account_name, name, information, extend_information,
+                 extend_information2) = get(row)
+                tdate = parse_date(tdate)
+                tamount = parse_amount(amount)
+            except RECORD_ERRORS as e:
+                self.reject(rows.line_num, _csv_line(row), e)
+                continue
 
-            account_number = normalize_field(row[4])
-            prepend_number = normalize_field(row[3])
-            bank_code = normalize_field(row[5])
+            account_number = normalize_field(account_number)
+            prepend_number = normalize_field(prepend_number)
+            bank_code = normalize_field(bank_code)
             tdest = None
 
             if account_number != "":
@@ -564,11 +1502,11 @@ class SlSpImport(BankImporter):
                         tdest = "%s-%s" % (prepend_number, tdest)
                         tdest = tdest.strip()
 
-            account_name = normalize_field(row[6])
-            name = normalize_field(row[11])
-            information = normalize_field(row[16])
-            extend_information = normalize_field(row[18]) + " " + \
-                normalize_field(row[22])
+            account_name = normalize_field(account_name)
+            name = normalize_field(name)
+            information = normalize_field(information)
+            extend_information = normalize_field(extend_information) + " " + \
+                normalize_field(extend_information2)
 
             tmessage = "%s %s %s" % (name, information, extend_information)
             tmessage = tmessage.strip()
@@ -579,47 +1517,1906 @@ class SlSpImport(BankImporter):
                                   destination=tdest)
 
 
-def write_qif(outfile, transactions):
-    with open(outfile, 'wb') as output:
-        writer = codecs.getwriter("utf-8")
-        outputwriter = writer(output)
-        outputwriter.write("!Type:Bank\n")
+EXPORTERS = {}
+
+
+def register_exporter(output_format):
+    def f(cls):
+        assert output_format not in EXPORTERS, "More exporters for the format?"
+        EXPORTERS[output_format] = cls
+        return cls
+    return f
+
+
+class Exporter(object):
+    """Base class for writing transactions to a sink
+
+    Transactions are collected into batches of batch_size, every batch is
+    rendered by render() and written at once. Sink can be a path ('-'
+    stands for stdout), binary or text file object, socket or bytearray.
+
+    To add a format, implement render() returning text or bytes for a
+    list of transactions, and header() and footer() if needed."""
+
+    batch_size = 1024
+    # Suffix of output files in batch mode
+    extension = None
+    # Output can be continued by appending batches, nothing is assembled
+    # in footer()
+    appendable = True
+    # Called with the exporter whenever a batch is written to the sink
+    on_flush = None
+    # Importer (or its class) of the transactions when known, currency
+    # and balances are read from it once all transactions are written
+    statement = None
+
+    def __init__(self, sink, encoding="utf-8", batch_size=None):
+        self.encoding = encoding
+        if batch_size:
+            self.batch_size = batch_size
+        self._owned = False
+        if isinstance(sink, bytearray):
+            self._write = sink.extend
+        elif hasattr(sink, 'sendall'):
+            self._write = sink.sendall
+        elif isinstance(sink, io.TextIOBase):
+            self.output = sink.buffer
+            self._write = sink.buffer.write
+        elif hasattr(sink, 'write'):
+            self.output = sink
+            self._write = sink.write
+        elif sink == '-':
+            self.output = sys.stdout.buffer
+            self._write = self.output.write
+        else:
+            self.output = open(sink, 'wb')
+            self._write = self.output.write
+            self._owned = True
+        self._batch = []
+        self._started = False
+        self.size = 0
+        self.count = 0
+
+    def header(self):
+        return u""
+
+    def render(self, transactions):
+        raise NotImplementedError()
+
+    def footer(self):
+        return u""
+
+    def _emit(self, data):
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        if data:
+            self._write(data)
+            self.size += len(data)
+
+    def write(self, transaction):
+        self._batch.append(transaction)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, transactions):
+        iterator = iter(transactions)
+        batch = self._batch
+        while True:
+            batch.extend(itertools.islice(iterator,
+                                          self.batch_size - len(batch)))
+            if len(batch) < self.batch_size:
+                break
+            self.flush()
+            batch = self._batch
+
+    def flush(self):
+        if not self._started:
+            self._started = True
+            self._emit(self.header())
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._emit(self.render(batch))
+            self.count += len(batch)
+        if hasattr(self, 'output'):
+            self.output.flush()
+        if self.on_flush is not None:
+            self.on_flush(self)
+
+    def close(self):
+        self.flush()
+        self._emit(self.footer())
+        if self._owned:
+            self.output.close()
+        elif hasattr(self, 'output'):
+            self.output.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # Output of a failed conversion isn't complete, so it is not
+            # reported as written
+            self.on_flush = None
+        self.close()
+
+
+@register_exporter("qif")
+class QIFWriter(Exporter):
+    """Writes transactions in QIF format"""
+
+    extension = '.qif'
+
+    def header(self):
+        return u"!Type:Bank\n"
+
+    def render(self, transactions):
+        parts = []
+        append = parts.append
         for transaction in transactions:
-            d, m, y = (transaction.date.day,
-                      transaction.date.month,
-                      transaction.date.year)
-            outputwriter.write(u"D%s/%s/%s\n" % (m, d, y))
-            outputwriter.write(u"T%.2f\n" % transaction.get_amount())
+            tdate = transaction.date
+            append(u"D%s/%s/%s\nT%s\n"
+                   % (tdate.month, tdate.day, tdate.year,
+                      format_amount(transaction.get_amount())))
             if transaction.ident:
-                outputwriter.write(u"#%s\n" % transaction.ident)
+                append(u"#%s\n" % transaction.ident)
             if transaction.message:
-                outputwriter.write(u"M%s\n" % transaction.message)
+                append(u"M%s\n" % transaction.message)
             if transaction.destination:
-                outputwriter.write(u"P%s\n" % transaction.destination)
+                append(u"P%s\n" % transaction.destination)
+            if transaction.category:
+                append(u"L%s\n" % transaction.category)
             if len(transaction.splits) > 1:
                 for split in transaction.splits:
                     if split.message:
-                        outputwriter.write(u"E%s\n" % split.message)
-                    outputwriter.write(u"$%.2f\n" % split.amount)
-            outputwriter.write(u'^\n')
+                        append(u"E%s\n" % split.message)
+                    append(u"$%s\n" % format_amount(split.amount))
+            append(u'^\n')
+        return u''.join(parts)
+
+
+@register_exporter("csv")
+class CSVExporter(Exporter):
+    """Writes one CSV row per transaction, amount is the total of splits"""
+
+    extension = '.csv'
+    columns = ('date', 'amount', 'ident', 'destination', 'message',
+               'category')
+
+    def header(self):
+        return u','.join(self.columns) + u'\r\n'
+
+    def render(self, transactions):
+        output = io.StringIO()
+        csv.writer(output).writerows(
+            (format_date(transaction.date),
+             format_amount(transaction.get_amount()),
+             transaction.ident, transaction.destination, transaction.message,
+             transaction.category)
+            for transaction in transactions)
+        return output.getvalue()
+
+
+@register_exporter("jsonl")
+class JSONLinesExporter(Exporter):
+    """Writes one JSON object per line
+
+    Amounts are strings with two decimal places, so they are not rounded
+    as binary floats by the readers."""
+
+    extension = '.jsonl'
+
+    def render(self, transactions):
+        import json
+        dumps = json.JSONEncoder(ensure_ascii=False,
+                                 separators=(',', ':')).encode
+        lines = []
+        for transaction in transactions:
+            record = {
+                'date': format_date(transaction.date),
+                'amount': format_amount(transaction.get_amount()),
+                'ident': transaction.ident,
+                'destination': transaction.destination,
+                'message': transaction.message,
+                'category': transaction.category,
+            }
+            if len(transaction.splits) > 1:
+                record['splits'] = [
+                    {'amount': format_amount(split.amount),
+                     'message': split.message}
+                    for split in transaction.splits]
+            lines.append(dumps(record))
+        lines.append(u'')
+        return u'\n'.join(lines)
+
+
+@register_exporter("ofx")
+class OFXExporter(Exporter):
+    """Writes OFX 2 bank statement
+
+    OFX states the period of the statement before the transactions, so
+    the rendered transactions are kept until the exporter is closed."""
+
+    extension = '.ofx'
+    appendable = False
+    # Currency of statements which don't tell it
+    currency = 'CZK'
+    account = 'UNKNOWN'
+    # Ledger balance in minor units for statements which don't state it
+    ledger_balance = None
+    report = sys.stderr
+
+    def __init__(self, sink, encoding="utf-8", batch_size=None):
+        super(OFXExporter, self).__init__(sink, encoding, batch_size)
+        self._transactions = []
+        self._first = None
+        self._last = None
+        self._occurrences = collections.Counter()
+
+    @staticmethod
+    def escape(text):
+        return (text.replace(u'&', u'&amp;').replace(u'<', u'&lt;')
+                .replace(u'>', u'&gt;'))
+
+    def fitid(self, transaction):
+        # Has to stay the same when the statement is exported again
+        if transaction.ident:
+            return transaction.ident.strip()
+        fingerprint = transaction_fingerprint(transaction)
+        self._occurrences[fingerprint] += 1
+        return u"%s.%d" % (codecs.encode(fingerprint, 'hex')[:16].decode(),
+                           self._occurrences[fingerprint])
+
+    def render(self, transactions):
+        escape = self.escape
+        append = self._transactions.append
+        for transaction in transactions:
+            tdate = transaction.date
+            if self._first is None or tdate < self._first:
+                self._first = tdate
+            if self._last is None or tdate > self._last:
+                self._last = tdate
+            amount = transaction.get_amount()
+            append(u"<STMTTRN><TRNTYPE>%s</TRNTYPE>"
+                   u"<DTPOSTED>%s</DTPOSTED><TRNAMT>%s</TRNAMT>"
+                   u"<FITID>%s</FITID>"
+                   % (amount < 0 and u'DEBIT' or u'CREDIT',
+                      tdate.strftime('%Y%m%d'), format_amount(amount),
+                      escape(self.fitid(transaction))))
+            if transaction.destination:
+                append(u"<NAME>%s</NAME>"
+                       % escape(transaction.destination[:32]))
+            if transaction.message:
+                append(u"<MEMO>%s</MEMO>" % escape(transaction.message[:255]))
+            append(u"</STMTTRN>\n")
+        return u""
+
+    def footer(self):
+        today = date.today().strftime('%Y%m%d')
+        balance = None
+        if self.statement is not None:
+            balance = self.statement.closing_balance
+        if balance is None:
+            balance = self.ledger_balance
+        if balance is None:
+            balance = 0
+            self.report.write(u"Warning: closing balance of the statement is "
+                              u"unknown, OFX ledger balance 0.00 is only a "
+                              u"placeholder\n")
+        currency = self.currency
+        if self.statement is not None:
+            currency = self.statement.currency
+        return u''.join([
+            u'<?xml version="1.0" encoding="%s"?>\n' % self.encoding.upper(),
+            u'<?OFX OFXHEADER="200" VERSION="211" SECURITY="NONE" '
+            u'OLDFILEUID="NONE" NEWFILEUID="NONE"?>\n',
+            u"<OFX><SIGNONMSGSRSV1><SONRS><STATUS><CODE>0</CODE>"
+            u"<SEVERITY>INFO</SEVERITY></STATUS><DTSERVER>%s</DTSERVER>"
+            u"<LANGUAGE>CES</LANGUAGE></SONRS></SIGNONMSGSRSV1>\n" % today,
+            u"<BANKMSGSRSV1><STMTTRNRS><TRNUID>0</TRNUID><STATUS>"
+            u"<CODE>0</CODE><SEVERITY>INFO</SEVERITY></STATUS><STMTRS>"
+            u"<CURDEF>%s</CURDEF><BANKACCTFROM><BANKID>0</BANKID>"
+            u"<ACCTID>%s</ACCTID><ACCTTYPE>CHECKING</ACCTTYPE>"
+            u"</BANKACCTFROM>\n" % (currency, self.escape(self.account)),
+            u"<BANKTRANLIST><DTSTART>%s</DTSTART><DTEND>%s</DTEND>\n"
+            % ((self._first or date.today()).strftime('%Y%m%d'),
+               (self._last or date.today()).strftime('%Y%m%d')),
+        ] + self._transactions + [
+            u"</BANKTRANLIST><LEDGERBAL><BALAMT>%s</BALAMT>"
+            u"<DTASOF>%s</DTASOF></LEDGERBAL></STMTRS></STMTTRNRS>"
+            u"</BANKMSGSRSV1></OFX>\n" % (format_amount(balance), today),
+        ])
+
+
+@register_exporter("columns")
+class ColumnExporter(Exporter):
+    """Writes transactions column by column for bulk loading
+
+    With pyarrow installed the output is an Arrow IPC stream with one
+    record batch per batch of transactions. Otherwise a simple typed
+    column file is written, see read_columns(). Dates are days since
+    1970-01-01 and amounts integer minor units (cents) in both, splits
+    are left out."""
+
+    extension = '.columns'
+    appendable = False
+    batch_size = 65536
+    magic = b'BANK2QIF-COLUMNS 1\n'
+    names = ('date', 'amount', 'ident', 'destination', 'message')
+    count_struct = struct.Struct('<I')
+    # date.toordinal() of 1970-01-01
+    epoch = 719163
+
+    def __init__(self, sink, encoding="utf-8", batch_size=None):
+        super(ColumnExporter, self).__init__(sink, encoding, batch_size)
+        try:
+            import pyarrow
+        except ImportError:
+            pyarrow = None
+        self.pyarrow = pyarrow
+        self._arrow_writer = None
+
+    def columns(self, transactions):
+        batch = TransactionBatch(transactions)
+        epoch = self.epoch
+        dates = array('i', (ordinal - epoch for ordinal in batch.dates))
+        return dates, batch.amounts, batch.idents, batch.destinations, \
+            batch.messages
+
+    def header(self):
+        if self.pyarrow is None:
+            return self.magic
+        pa = self.pyarrow
+        self.schema = pa.schema([('date', pa.date32()),
+                                 ('amount', pa.int64()),
+                                 ('ident', pa.string()),
+                                 ('destination', pa.string()),
+                                 ('message', pa.string())])
+        self._arrow_writer = pa.ipc.new_stream(
+            pa.PythonFile(_WriteAdapter(self._emit), mode='w'), self.schema)
+        return b''
+
+    def render(self, transactions):
+        columns = self.columns(transactions)
+        if self._arrow_writer is not None:
+            self._arrow_writer.write_batch(self.pyarrow.record_batch(
+                [self.pyarrow.array(column, type=field.type)
+                 for column, field in zip(columns, self.schema)],
+                schema=self.schema))
+            return b''
+        dates, amounts = columns[:2]
+        if sys.byteorder != 'little':
+            dates, amounts = array('i', dates), array('q', amounts)
+            dates.byteswap()
+            amounts.byteswap()
+        parts = [self.count_struct.pack(len(dates)), dates.tobytes(),
+                 amounts.tobytes()]
+        for column in columns[2:]:
+            # Offsets into concatenated UTF-8 values, empty for None
+            values = [(value or u'').encode('utf-8') for value in column]
+            offsets = array('I', [0])
+            offset = 0
+            for value in values:
+                offset += len(value)
+                offsets.append(offset)
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+            parts.append(offsets.tobytes())
+            parts.append(b''.join(values))
+        return b''.join(parts)
+
+    def footer(self):
+        if self._arrow_writer is not None:
+            self._arrow_writer.close()
+        return b''
+
+
+class _WriteAdapter(object):
+    """Minimal writable file passing data to a function"""
+    closed = False
+
+    def __init__(self, write):
+        self.write = write
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def read_columns(infile):
+    """Reads file written by ColumnExporter without pyarrow
+
+    Returns dict mapping column names to lists (array for amounts) of
+    values of all transactions."""
+    data = open_input(infile).read()
+    if not data.startswith(ColumnExporter.magic):
+        raise ValueError("Not a column file")
+    result = dict((name, []) for name in ColumnExporter.names)
+    result['amount'] = array('q')
+    pos = len(ColumnExporter.magic)
+    while pos < len(data):
+        count, = ColumnExporter.count_struct.unpack_from(data, pos)
+        pos += ColumnExporter.count_struct.size
+        dates = array('i', data[pos:pos + 4 * count])
+        pos += 4 * count
+        amounts = array('q', data[pos:pos + 8 * count])
+        pos += 8 * count
+        if sys.byteorder != 'little':
+            dates.byteswap()
+            amounts.byteswap()
+        result['date'].extend(date.fromordinal(ColumnExporter.epoch + days)
+                              for days in dates)
+        result['amount'].extend(amounts)
+        for name in ColumnExporter.names[2:]:
+            offsets = array('I', data[pos:pos + 4 * (count + 1)])
+            pos += 4 * (count + 1)
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+            values = data[pos:pos + offsets[-1]]
+            pos += offsets[-1]
+            result[name].extend(
+                values[offsets[i]:offsets[i + 1]].decode('utf-8')
+                for i in range(count))
+    return result
+
+
+def write_transactions(outfile, transactions, stats=None,
+                       output_format='qif', checkpoint=None, statement=None):
+    with EXPORTERS[output_format](outfile) as writer:
+        writer.statement = statement
+        if checkpoint is not None:
+            checkpoint.attach(writer)
+        if stats is None:
+            writer.write_all(transactions)
+            return
+        with stats.collecting('write'):
+            writer.write_all(stats.timed_iter('parse', transactions,
+                                              'transactions'))
+            writer.flush()
+        stats.count('bytes_written', writer.size)
+
+
+def write_qif(outfile, transactions, stats=None):
+    write_transactions(outfile, transactions, stats)
+
+
+class ParseCache(object):
+    """On-disk cache of parsed statements
+
+    Entries are keyed by importer, importer version and hash of the
+    statement content and hold serialized TransactionBatch. Once the
+    total size of the cache exceeds max_size, the least recently used
+    entries are removed."""
+
+    format_version = 1
+
+    def __init__(self, directory, max_size=256 << 20):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, importer_class, content):
+        import hashlib
+        digest = hashlib.sha256(content).hexdigest()
+        return "%s-%s-%s-%s" % (importer_class.__name__,
+                                importer_class.version,
+                                self.format_version, digest)
+
+    def get(self, key):
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as entry:
+                data = entry.read()
+            # Modification time records the last use
+            os.utime(path)
+        except OSError:
+            return None
+        try:
+            return TransactionBatch.loads(data)
+        except ValueError:
+            # Corrupt or foreign entry is parsed again and replaced
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key, transactions):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, key)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, 'wb') as entry:
+            entry.write(transactions.dumps())
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def _parse_chunk(job):
+    source, chunk = job
+    return TransactionBatch(IMPORTERS[source](chunk))
+
+
+def parse_in_chunks(source, content, processes=None, chunk_records=None):
+    """Yields transactions of one statement parsed in parallel
+
+    Statement is split into chunks of records which are parsed in pool of
+    processes, each chunk gets the context (like header) it needs.
+    Transactions are yielded in the original order. Statements which
+    can't be split are parsed sequentially."""
+    importer_class = IMPORTERS[source]
+    split = importer_class.split_records(content)
+    if split is None:
+        for transaction in importer_class(content):
+            yield transaction
+        return
+
+    prefix, records = split
+    processes = processes or available_cpus()
+    if not chunk_records:
+        # Few chunks per process to even out the load
+        chunk_records = max(1000, -(-len(records) // (processes * 4)))
+    jobs = [(source, prefix + b''.join(records[i:i + chunk_records]))
+            for i in range(0, len(records), chunk_records)]
+    import multiprocessing
+    with multiprocessing.Pool(processes) as pool:
+        for batch in pool.imap(_parse_chunk, jobs):
+            for transaction in batch:
+                yield transaction
+
+
+class Reconciliation(object):
+    """Checks transactions of a statement against its balances
+
+    Transactions are summed as they pass through check(), so nothing but
+    the totals is kept. At the end of every statement opening balance plus
+    the total must give closing balance found by the importer, statements
+    concatenated in one input are checked each on its own. Problems raise
+    ReconciliationError when strict, otherwise they are reported."""
+
+    def __init__(self, importer, strict=True, report=sys.stderr):
+        self.importer = importer
+        self.strict = strict
+        self.report = report
+        self.count = 0
+        self.total = 0
+        self.problems = []
+        # Statement summed now and its balances taken when it started
+        self.statement = None
+        self.balances = (None, None)
+
+    def problem(self, message):
+        if self.importer.statement_no > 1:
+            message = "Statement %d: %s" % (self.statement, message)
+        if self.strict:
+            raise ReconciliationError(message)
+        self.problems.append(message)
+        self.report.write(u"Warning: %s\n" % message)
+
+    def __iter__(self):
+        return self.check(self.importer)
+
+    def check(self, transactions):
+        importer = self.importer
+        for transaction in transactions:
+            if importer.statement_no != self.statement:
+                if self.statement is not None:
+                    self.finish(*self.balances)
+                self.statement = importer.statement_no
+                self.balances = (importer.opening_balance,
+                                 importer.closing_balance)
+                self.count = 0
+                self.total = 0
+            self.count += 1
+            amount = transaction.get_amount()
+            if amount is None:
+                self.problem("Transaction %d has no amount" % self.count)
+            else:
+                if (transaction.splits and transaction.amount is not None and
+                        transaction.amount != amount):
+                    self.problem("Splits of transaction %d don't add up to "
+                                 "%s" % (self.count,
+                                         format_amount(transaction.amount)))
+                self.total += amount
+            yield transaction
+        if self.statement is not None and \
+                importer.statement_no != self.statement:
+            # The last statement has no transactions
+            self.finish(*self.balances)
+            self.statement = importer.statement_no
+            self.count = 0
+            self.total = 0
+        # Balances can follow the transactions, like in mBank statements
+        self.finish(importer.opening_balance, importer.closing_balance)
+
+    def finish(self, opening, closing):
+        if opening is None or closing is None:
+            self.problem("Balances not found in the statement")
+        elif opening + self.total != closing:
+            self.problem("Opening balance %s and %d transactions (%s) give "
+                         "%s, closing balance is %s"
+                         % (format_amount(opening), self.count,
+                            format_amount(self.total),
+                            format_amount(opening + self.total),
+                            format_amount(closing)))
+
+
+def load_transactions(infile, source, cache=None, stats=None, parallel=None,
+                      reconcile=None, errors=None):
+    """Returns transactions from infile parsed by importer for source
+
+    With cache given, transactions of statements parsed before are
+    replayed from it. Parallel is number of processes parsing chunks of
+    the statement. Reconcile ('fail' or 'warn') checks the transactions
+    against balances of the statement while they are parsed. Errors is
+    ErrorPolicy for bad records. Both always use a single importer."""
+    importer_class = IMPORTERS[source]
+    if reconcile or errors is not None or (cache is None and not parallel):
+        importer = importer_class(infile, stats=stats, errors=errors)
+        if reconcile:
+            return Reconciliation(importer, reconcile == 'fail')
+        return importer
+
+    content = open_input(infile).read()
+    if cache is not None:
+        key = cache.key(importer_class, content)
+        transactions = cache.get(key)
+        if transactions is not None:
+            return transactions
+    if parallel:
+        transactions = parse_in_chunks(source, content, parallel)
+    else:
+        transactions = importer_class(content, stats=stats)
+    if cache is not None:
+        if stats is None:
+            transactions = TransactionBatch(transactions)
+        else:
+            # Statement is parsed right here, not while it is written
+            with stats.collecting():
+                transactions = TransactionBatch(transactions)
+        cache.put(key, transactions)
+    return transactions
+
+
+class Checkpoint(object):
+    """Progress of conversion of a statement into a file
+
+    Saved whenever a batch is written: position of the last record of the
+    statement converted by then, number of transactions written and sizes
+    of the output and quarantine files. Conversion resumed from it skips
+    the records up to the position without converting or rejecting them
+    again and continues the files cut back to the sizes, so the records
+    after the last checkpoint are handled exactly once."""
+    def __init__(self, path, infile, source, errors=None):
+        self.path = path
+        self.errors = errors
+        stat = os.stat(infile)
+        self.statement = {
+            'input': os.path.abspath(infile),
+            'type': source,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+        self.position = 0
+        self.transactions = 0
+        self.output_size = 0
+        self.quarantine_size = 0
+        self.importer = None
+
+    def load(self):
+        """Restores saved progress, returns False if there is none
+
+        Raises ValueError if it is progress of another statement."""
+        import json
+        try:
+            with open(self.path, 'rt', encoding='utf-8') as state:
+                saved = json.load(state)
+        except FileNotFoundError:
+            return False
+        if saved['statement'] != self.statement:
+            raise ValueError("Checkpoint %s is for another statement or the "
+                             "statement changed" % (self.path,))
+        self.position = saved['position']
+        self.transactions = saved['transactions']
+        self.output_size = saved['output_size']
+        self.quarantine_size = saved['quarantine_size']
+        return True
+
+    def save(self):
+        import json
+        if self.errors is not None:
+            self.quarantine_size = self.errors.quarantine_size()
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, 'wt', encoding='utf-8') as state:
+            json.dump({'statement': self.statement,
+                       'position': self.position,
+                       'transactions': self.transactions,
+                       'output_size': self.output_size,
+                       'quarantine_size': self.quarantine_size},
+                      state, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def track(self, importer):
+        """Makes importer start after the checkpoint and returns it
+
+        Transactions of the importer must be written one to one, the
+        position saved is the one of the importer when a batch is
+        written."""
+        importer.resume_position = self.position
+        self.importer = importer
+        return importer
+
+    def attach(self, writer):
+        """Makes writer continue the output and save checkpoints"""
+        # Header is already there
+        writer._started = self.output_size > 0
+        start = self.output_size
+        transactions = self.transactions
+
+        def flushed(writer):
+            # Only what is rendered counts, transactions read from the
+            # statement may still wait in the batch
+            self.position = self.importer.position
+            self.transactions = transactions + writer.count
+            self.output_size = start + writer.size
+            self.save()
+        writer.on_flush = flushed
+
+
+def statement_of(transactions, source):
+    """Returns importer behind transactions from load_transactions()
+
+    For statements replayed from cache or parsed in parallel it is the
+    importer class of source, which knows the currency but no balances."""
+    if isinstance(transactions, Reconciliation):
+        return transactions.importer
+    if isinstance(transactions, BankImporter):
+        return transactions
+    return IMPORTERS[source]
+
+
+class WatermarkStore(object):
+    """Persistent per-account watermarks of incremental conversion
+
+    Watermark is a dictionary with type of statement, offset of the first
+    record not converted yet (counted from the start of records, see
+    split_records), hash of records before it and date and identifier of
+    the last converted transaction."""
+    def __init__(self, path):
+        self.path = path
+        self.watermarks = {}
+        if os.path.exists(path):
+            import json
+            with open(path, 'rt', encoding='utf-8') as state:
+                self.watermarks = json.load(state)
+
+    def get(self, account):
+        return self.watermarks.get(account)
+
+    def set(self, account, watermark):
+        self.watermarks[account] = watermark
+
+    def save(self):
+        import json
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, 'wt', encoding='utf-8') as state:
+            json.dump(self.watermarks, state, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def incremental_transactions(content, source, watermark=None, errors=None):
+    """Parses only records of statement added since watermark was taken
+
+    Returns list of new transactions and watermark to use next time. If
+    the already converted part of the statement changed, the whole
+    statement is parsed again. Errors is ErrorPolicy for bad records."""
+    importer_class = IMPORTERS[source]
+    split = importer_class.split_records(content)
+    if split is None:
+        raise ValueError("Statements of type %s can't be converted "
+                         "incrementally" % (source,))
+    prefix, records = split
+    data = b''.join(records)
+
+    import hashlib
+    skip = 0
+    if (watermark and watermark['type'] == source and
+            watermark['offset'] <= len(data) and
+            hashlib.sha256(data[:watermark['offset']]).hexdigest() ==
+            watermark['hash']):
+        offset = 0
+        for record in records:
+            if offset >= watermark['offset']:
+                break
+            offset += len(record)
+            skip += 1
+        if offset != watermark['offset']:
+            # Watermark isn't on record boundary any more
+            skip = 0
+
+    transactions = []
+    if records[skip:]:
+        transactions = list(importer_class(prefix + b''.join(records[skip:]),
+                                           errors=errors))
+    new_watermark = {
+        'type': source,
+        'offset': len(data),
+        'hash': hashlib.sha256(data).hexdigest(),
+        'last_date': None,
+        'last_ident': None,
+    }
+    if transactions:
+        new_watermark['last_date'] = transactions[-1].date.strftime('%Y-%m-%d')
+        new_watermark['last_ident'] = transactions[-1].ident
+    elif watermark:
+        new_watermark['last_date'] = watermark.get('last_date')
+        new_watermark['last_ident'] = watermark.get('last_ident')
+    return transactions, new_watermark
+
+
+class BloomFilter(object):
+    """Probabilistic set of bytes keys
+
+    Sized to hold capacity keys with given rate of false positives."""
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) /
+                                math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        import hashlib
+        self._blake2b = hashlib.blake2b
+
+    def _positions(self, key):
+        h1, h2 = struct.unpack('<QQ', self._blake2b(key,
+                                                    digest_size=16).digest())
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class DedupIndex(object):
+    """Persistent index of transactions converted before
+
+    Keys are kept in SQLite database at path, Bloom filter stored next to
+    it answers most lookups for new transactions without touching the
+    database. Filter is rebuilt from the database when it's missing or
+    gets too full. Keys added are committed only by close(), once the
+    output is written, discard() forgets them when the conversion fails."""
+
+    header = struct.Struct('<QQQQ')
+    flush_size = 10000
+
+    def __init__(self, path, capacity=1 << 20, error_rate=0.01):
+        self.path = path
+        self.bloom_path = path + '.bloom'
+        self.error_rate = error_rate
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen "
+                        "(key BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.pending = set()
+        self.bloom = self._load_bloom()
+        count = self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+        # filter left behind by interrupted run would miss some keys
+        if (self.bloom is None or self.bloom.count != count or
+                count > self.bloom.capacity):
+            self._rebuild_bloom(capacity)
+
+    def _load_bloom(self):
+        try:
+            with open(self.bloom_path, 'rb') as bloom_file:
+                capacity, size, hashes, count = self.header.unpack(
+                    bloom_file.read(self.header.size))
+                bloom = BloomFilter(capacity, self.error_rate)
+                if (bloom.size, bloom.hashes) != (size, hashes):
+                    return None
+                bloom.count = count
+                bloom_file.readinto(bloom.bits)
+                return bloom
+        except (OSError, struct.error):
+            return None
+
+    def _rebuild_bloom(self, capacity):
+        count = self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+        while capacity < count * 2:
+            capacity *= 4
+        self.bloom = BloomFilter(capacity, self.error_rate)
+        for key, in self.db.execute("SELECT key FROM seen"):
+            self.bloom.add(key)
+
+    def __contains__(self, key):
+        if key not in self.bloom:
+            return False
+        if key in self.pending:
+            return True
+        return self.db.execute("SELECT 1 FROM seen WHERE key = ?",
+                               (key,)).fetchone() is not None
+
+    def add(self, key):
+        self.bloom.add(key)
+        self.pending.add(key)
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        # Stays in the open transaction until close()
+        self.db.executemany("INSERT OR IGNORE INTO seen VALUES (?)",
+                            ((key,) for key in self.pending))
+        self.pending = set()
+
+    def discard(self):
+        """Forgets keys added since opening the index"""
+        self.pending = set()
+        self.db.rollback()
+        self.db.close()
+
+    def close(self):
+        self.flush()
+        self.db.commit()
+        if self.bloom.count > self.bloom.capacity:
+            self._rebuild_bloom(self.bloom.capacity)
+        self.db.close()
+        tmp_path = "%s.%d.tmp" % (self.bloom_path, os.getpid())
+        with open(tmp_path, 'wb') as bloom_file:
+            bloom_file.write(self.header.pack(self.bloom.capacity,
+                                              self.bloom.size,
+                                              self.bloom.hashes,
+                                              self.bloom.count))
+            bloom_file.write(self.bloom.bits)
+        os.replace(tmp_path, self.bloom_path)
+
+
+def transaction_fingerprint(transaction):
+    """Returns key identifying the transaction across statements
+
+    Identifier from the bank is used when available, otherwise date,
+    amount, counterparty and message."""
+    if transaction.ident:
+        return b'#' + transaction.ident.strip().encode('utf-8')
+    import hashlib
+    key = u"%d|%d|%s|%s" % (transaction.date.toordinal(),
+                            transaction.get_amount(),
+                            normalize_field(transaction.destination or ''),
+                            normalize_field(transaction.message or ''))
+    return hashlib.sha1(key.encode('utf-8')).digest()
+
+
+def deduplicate(transactions, index):
+    """Yields transactions of one statement which are not in index yet
+
+    Same transactions can legitimately appear in one statement more
+    times (two coffees a day), so the keys include number of the
+    occurrence within the statement."""
+    occurrences = collections.Counter()
+    for transaction in transactions:
+        fingerprint = transaction_fingerprint(transaction)
+        occurrences[fingerprint] += 1
+        key = b'%s/%d' % (fingerprint, occurrences[fingerprint])
+        if key in index:
+            continue
+        index.add(key)
+        yield transaction
+
+
+class _Automaton(object):
+    """Aho-Corasick automaton finding many substrings in one pass
+
+    Patterns are (text, key), keys of all patterns found are reported."""
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for text, key in patterns:
+            state = 0
+            for char in text:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (key,)
+        # Breadth first, so fail links point to already finished states
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                if fail == next_state:
+                    fail = 0
+                self.fail[next_state] = fail
+                self.output[next_state] += self.output[fail]
+
+    def search(self, text):
+        goto, fail, output = self.goto, self.fail, self.output
+        states = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                states.add(state)
+        found = set()
+        for state in states:
+            found.update(output[state])
+        return found
+
+
+def _literal_prefix(pattern):
+    """Returns text every match of regular expression pattern starts with
+
+    Only plain ASCII letters, digits and spaces are considered, so the
+    result is empty for anything not simple enough."""
+    if '|' in pattern:
+        return ''
+    prefix = re.match(r'\^?([A-Za-z0-9 ]*)', pattern)
+    text = prefix.group(1)
+    if pattern[prefix.end():prefix.end() + 1] in ('?', '*', '{'):
+        # Quantifier applies to the last character only
+        text = text[:-1]
+    return text
+
+
+# Backreferences and conditionals, which would refer to other groups in
+# the combined expression
+_group_reference_re = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+def _combinable(pattern):
+    """Tells whether regular expression pattern means the same as a part
+    of a bigger one
+
+    Pattern is compiled as a named group of the combined expression,
+    inline global flags fail there (or warn on older Pythons), named
+    groups must be unique and backreferences would refer to other groups,
+    which is checked in the text of the pattern."""
+    if _group_reference_re.search(pattern):
+        return False
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        try:
+            regex = re.compile('(?P<_rule>%s)' % (pattern,), re.I | re.S)
+        except (re.error, Warning):
+            return False
+    return list(regex.groupindex) == ['_rule']
+
+
+class Categorizer(object):
+    """Assigns categories and payees to transactions by rules
+
+    Rules are (pattern, category, payee) with payee possibly None,
+    pattern starting with "re:" is a regular expression, other patterns
+    are substrings. Both are matched case-insensitively against
+    counterparty and message and the first matching rule wins. Substrings
+    are searched for by a single automaton, which also finds literal
+    prefixes of regular expressions, so those are tried only when the
+    prefix is present. Remaining regular expressions are combined into
+    one, except those with inline global flags, named groups or
+    backreferences, which would mean something else there and are tried
+    one by one. Results are cached per distinct counterparty and
+    message."""
+
+    def __init__(self, rules, cache_size=65536):
+        self.rules = []
+        self.regex_rules = {}
+        self.prefixed = {}
+        # (index, search) of expressions which can't be combined
+        self.separate = []
+        literals = []
+        regexes = []
+        seen = set()
+        for index, (pattern, category, payee) in enumerate(rules):
+            self.rules.append((category, payee or None))
+            if pattern.startswith('re:'):
+                if pattern in seen:
+                    # Only the first of the same expressions can win
+                    continue
+                seen.add(pattern)
+                try:
+                    regex = re.compile(pattern[3:], re.I | re.S)
+                except re.error as e:
+                    raise ValueError("Bad regular expression %r: %s"
+                                     % (pattern[3:], e))
+                prefix = _literal_prefix(pattern[3:])
+                if len(prefix) >= 3:
+                    literals.append((prefix.casefold(), index))
+                    self.prefixed[index] = regex.search
+                    continue
+                if not _combinable(pattern[3:]):
+                    self.separate.append((index, regex.search))
+                    continue
+                name = '_rule%d' % index
+                regexes.append('(?P<%s>%s)' % (name, pattern[3:]))
+                self.regex_rules[name] = index
+            else:
+                literals.append((pattern.casefold(), index))
+        self.automaton = _Automaton(literals) if literals else None
+        # Alternatives are tried in order of the rules, so a match is the
+        # first rule matching at its position
+        self.regex = None
+        if regexes:
+            self.regex = re.compile('|'.join(regexes), re.I | re.S)
+        self.match = functools.lru_cache(maxsize=cache_size)(self._match)
+
+    @classmethod
+    def from_file(cls, path):
+        """Loads rules from lines "pattern<TAB>category[<TAB>payee]"
+
+        Empty lines and lines starting with # are skipped."""
+        rules = []
+        with open(path, 'rt', encoding='utf-8') as rules_file:
+            for line_no, line in enumerate(rules_file, 1):
+                line = line.rstrip('\r\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                fields = line.split('\t')
+                if len(fields) not in (2, 3) or not fields[0]:
+                    raise ValueError("Bad rule on line %d of %s"
+                                     % (line_no, path))
+                fields.append(None)
+                rules.append(tuple(fields[:3]))
+        return cls(rules)
+
+    def _match(self, text):
+        found = None
+        if self.automaton is not None:
+            prefixed = self.prefixed
+            for index in sorted(self.automaton.search(text.casefold())):
+                search = prefixed.get(index)
+                if search is None or search(text):
+                    found = index
+                    break
+        if self.regex is not None:
+            search = self.regex.search
+            regex_rules = self.regex_rules
+            matches = search(text)
+            while matches is not None:
+                index = regex_rules[matches.lastgroup]
+                if found is None or index < found:
+                    found = index
+                if matches.start() >= len(text):
+                    # Empty match at the end, search would find it again
+                    break
+                # Matches of other rules can overlap this one
+                matches = search(text, matches.start() + 1)
+        for index, search in self.separate:
+            if found is not None and index > found:
+                break
+            if search(text):
+                found = index
+                break
+        if found is None:
+            return None
+        return self.rules[found]
+
+    def categorize(self, transactions):
+        """Yields transactions with category and payee set by the rules"""
+        match = self.match
+        for transaction in transactions:
+            rule = match(u"%s\n%s" % (transaction.destination or u'',
+                                      transaction.message or u''))
+            if rule is not None:
+                transaction.category, payee = rule
+                if payee:
+                    transaction.destination = payee
+            yield transaction
+
+
+@functools.lru_cache(maxsize=None)
+def load_rules(path):
+    """Returns Categorizer for rules file, loaded once per process"""
+    return Categorizer.from_file(path)
+
+
+def signature_index():
+    """Returns [(encoding, [(signature regex, source), ...]), ...]
+
+    Built from signatures of registered importers, sources in every group
+    are in order of registration."""
+    global _signature_index
+    if _signature_index is None:
+        index = {}
+        for source, cls in IMPORTERS.items():
+            signature = cls.get_signature()
+            if signature is not None:
+                group = index.setdefault(cls.input_encoding, [])
+                group.append((re.compile(signature, re.M), source))
+        _signature_index = list(index.items())
+    return _signature_index
+
+
+class _PrefixedStream(io.RawIOBase):
+    """Stream returning already consumed head before rest of stream"""
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        return self._stream.readinto(buffer)
+
+
+def detect_importer(infile, sniff_size=8192):
+    """Guesses type of statement from its first sniff_size bytes
+
+    Returns (source, input) where input has to be used instead of infile
+    for the import as the sniffed data can't always be put back."""
+    if isinstance(infile, (bytes, bytearray, memoryview)):
+        head = bytes(infile[:sniff_size])
+    elif isinstance(infile, str) and infile != '-':
+        with open(infile, 'rb') as stream:
+            head = stream.read(sniff_size)
+    else:
+        stream = open_input(infile)
+        head = stream.read(sniff_size)
+        if stream.seekable():
+            stream.seek(-len(head), io.SEEK_CUR)
+            infile = stream
+        else:
+            infile = io.BufferedReader(_PrefixedStream(head, stream))
+
+    for encoding, signatures in signature_index():
+        try:
+            # Incremental decoder doesn't choke on character cut in half
+            # at the end of sniffed data
+            text = codecs.getincrementaldecoder(encoding)().decode(head)
+        except UnicodeDecodeError:
+            continue
+        for signature, source in signatures:
+            if signature.search(text):
+                return source, infile
+    raise ValueError("Unable to detect type of statement")
+
+
+def available_cpus():
+    """Number of cores this process is allowed to run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def collect_batch_inputs(spec, source, skip=('.rejected', '.checkpoint')):
+    """Returns list of (file, type) pairs to convert in batch mode
+
+    spec can be a directory (all files in it), a glob pattern or a
+    manifest file with one "file;type" pair per line. Type can be
+    omitted in the manifest, source is used then. Relative paths in
+    manifest are relative to the manifest itself. Files with extensions
+    in skip (outputs of previous runs) are left out of directories and
+    glob matches."""
+    def wanted(path):
+        return (os.path.isfile(path) and
+                os.path.splitext(path)[1].lower() not in skip)
+
+    if os.path.isdir(spec):
+        names = sorted(os.listdir(spec))
+        paths = [os.path.join(spec, name) for name in names]
+        return [(path, source) for path in paths if wanted(path)]
+
+    if os.path.isfile(spec):
+        jobs = []
+        basedir = os.path.dirname(spec)
+        with open(spec, 'rt', encoding='utf-8') as manifest:
+            for row in csv.reader(manifest, delimiter=';'):
+                if not row or not row[0].strip() or row[0].startswith('#'):
+                    continue
+                path = os.path.join(basedir, row[0].strip())
+                path_source = source
+                if len(row) > 1 and row[1].strip():
+                    path_source = row[1].strip()
+                if path_source not in IMPORTERS and path_source != 'auto':
+                    raise ValueError("Unknown type '%s' for %s in manifest"
+                                     % (path_source, path))
+                jobs.append((path, path_source))
+        return jobs
+
+    import glob
+    return [(path, source) for path in sorted(glob.glob(spec))
+            if wanted(path)]
+
+
+class BatchResult(object):
+    """Outcome of conversion of one file in batch mode"""
+    def __init__(self, infile, source, outfile=None):
+        self.infile = infile
+        self.source = source
+        self.outfile = outfile
+        self.count = 0
+        self.size = 0
+        self.elapsed = 0.0
+        self.error = None
+        self.rejected = 0
+        self.transactions = None
+
+
+def convert_batch_item(job):
+    """Converts one (file, type, outfile, cache, format, reconcile, rules,
+    errors) job in a batch worker
+
+    With outfile set to None the parsed transactions are sent back to
+    the parent process instead so that it can merge them. Errors is None
+    or (mode, quarantine file) of ErrorPolicy."""
+    (infile, source, outfile, cache, output_format, reconcile, rules,
+     errors) = job
+    result = BatchResult(infile, source, outfile)
+    start = time.time()
+    try:
+        result.size = os.path.getsize(infile)
+        if source == 'auto':
+            source, _ = detect_importer(infile)
+            result.source = source
+        if errors is not None:
+            errors = ErrorPolicy(*errors)
+        try:
+            transactions = load_transactions(infile, source, cache,
+                                             reconcile=reconcile,
+                                             errors=errors)
+            statement = statement_of(transactions, source)
+            if not isinstance(transactions, TransactionBatch):
+                transactions = TransactionBatch(transactions)
+        finally:
+            if errors is not None:
+                errors.close()
+                result.rejected = errors.rejected
+        if outfile is None:
+            result.transactions = transactions
+        else:
+            written = transactions
+            if rules:
+                written = load_rules(rules).categorize(written)
+            write_transactions(outfile, written, output_format=output_format,
+                               statement=statement)
+        result.count = len(transactions)
+    except Exception as e:
+        result.error = "%s: %s" % (e.__class__.__name__, e)
+    result.elapsed = time.time() - start
+    return result
+
+
+def batch_output_name(infile, output_dir, extension='.qif'):
+    base = os.path.splitext(os.path.basename(infile))[0]
+    return os.path.join(output_dir or os.path.dirname(infile),
+                        base + extension)
+
+
+def batch_outputs(jobs, output_dir, extension, merged=False, errors=False):
+    """Returns (output file, quarantine file) for every (file, type) job
+
+    Output file is None when merged, quarantine file unless errors.
+    Raises ValueError when two inputs would be written to the same file
+    or an output would replace an input."""
+    inputs = set(os.path.abspath(infile) for infile, _ in jobs)
+    targets = {}
+    outputs = []
+    for infile, _ in jobs:
+        names = (None if merged else
+                 batch_output_name(infile, output_dir, extension),
+                 batch_output_name(infile, output_dir, '.rejected')
+                 if errors else None)
+        for name in names:
+            if name is None:
+                continue
+            path = os.path.abspath(name)
+            if path in inputs:
+                raise ValueError("Output %s would replace an input" % (name,))
+            if path in targets:
+                raise ValueError("Both %s and %s would be written to %s"
+                                 % (targets[path], infile, name))
+            targets[path] = infile
+        outputs.append(names)
+    return outputs
+
+
+def run_batch(jobs, output=None, output_dir=None, processes=None,
+              report=sys.stderr, cache=None, dedup=None, output_format='qif',
+              reconcile=None, rules=None, on_error='strict'):
+    """Converts all (file, type) jobs using pool of worker processes
+
+    If output is given, all transactions are merged into this single
+    file in the order of jobs, with dedup index given transactions seen
+    before are left out. Otherwise every input gets its own output file
+    in output_dir. Rules is path of categorization rules file. On_error
+    is mode of ErrorPolicy, quarantined records of every input go to
+    file with .rejected suffix in output_dir. Returns list of
+    BatchResult."""
+    outputs = batch_outputs(jobs, output_dir,
+                            EXPORTERS[output_format].extension,
+                            output is not None, on_error != 'strict')
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    work = []
+    for (infile, source), (outfile, quarantine) in zip(jobs, outputs):
+        errors = None
+        if quarantine is not None:
+            errors = (on_error, quarantine)
+        work.append((infile, source, outfile, cache, output_format,
+                     reconcile, rules, errors))
+
+    processes = max(1, min(processes or available_cpus(), len(work) or 1))
+    start = time.time()
+    results = []
+    import multiprocessing
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap(convert_batch_item, work):
+            results.append(result)
+            if result.error:
+                report.write(u"FAILED %s (%s): %s\n" % (result.infile,
+                                                        result.source,
+                                                        result.error))
+            else:
+                report.write(u"OK %s (%s): %d transactions in %.2fs%s\n"
+                             % (result.infile, result.source, result.count,
+                                result.elapsed,
+                                result.rejected and u", %d rejected"
+                                % result.rejected or u""))
+
+    if output is not None:
+        statements = [result.transactions or () for result in results]
+        if dedup is not None:
+            statements = [deduplicate(statement, dedup)
+                          for statement in statements]
+        merged = (transaction for statement in statements
+                  for transaction in statement)
+        if rules:
+            merged = load_rules(rules).categorize(merged)
+        write_transactions(output, merged, output_format=output_format)
+    elapsed = max(time.time() - start, 1e-6)
+
+    failed = [result for result in results if result.error]
+    count = sum(result.count for result in results)
+    size = sum(result.size for result in results)
+    report.write(u"%d files (%d failed), %d transactions, %.2f MB in %.2fs "
+                 u"using %d processes: %.1f files/s, %.1f transactions/s, "
+                 u"%.2f MB/s\n"
+                 % (len(results), len(failed), count, size / 1e6, elapsed,
+                    processes, len(results) / elapsed, count / elapsed,
+                    size / 1e6 / elapsed))
+    return results
+
+
+class _QueueSink(object):
+    """QIFWriter sink handing written chunks over to asyncio queue
+
+    Writing blocks while the queue is full, which slows the producing
+    thread down to the speed of the client."""
+    def __init__(self, queue, loop):
+        self.queue = queue
+        self.loop = loop
+        self.cancelled = False
+
+    def put(self, item):
+        if self.cancelled:
+            raise ConnectionError("Client went away")
+        import asyncio
+        asyncio.run_coroutine_threadsafe(self.queue.put(item),
+                                         self.loop).result()
+
+    def write(self, data):
+        self.put(data)
+
+    def flush(self):
+        pass
+
+
+class ConversionServer(object):
+    """Long-running service converting statements sent over a socket
+
+    Client sends line "<type> <length>" followed by length bytes of the
+    statement, type can be "auto". QIF is streamed back as transactions
+    are produced and the connection is closed afterwards. If the
+    conversion fails, the output ends with line "!Error: <message>".
+
+    At most jobs statements are received and converted at once in worker
+    threads, other clients wait before their statements are read, so
+    memory taken by them is bounded as well."""
+
+    # Transactions rendered before a chunk is sent to the client
+    batch_size = 64
+
+    def __init__(self, jobs=None, queue_size=16, max_size=64 << 20):
+        self.jobs = jobs or available_cpus()
+        self.queue_size = queue_size
+        self.max_size = max_size
+        import concurrent.futures
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        self.semaphore = None
+
+    async def start(self, address):
+        """Starts listening on "host:port" or path of Unix socket"""
+        import asyncio
+        self.semaphore = asyncio.Semaphore(self.jobs)
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            return await asyncio.start_server(self.handle, host, int(port))
+        return await asyncio.start_unix_server(self.handle, address)
+
+    async def serve_forever(self, address):
+        server = await self.start(address)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        import asyncio
+        try:
+            header = await reader.readline()
+            try:
+                source, length = header.decode('ascii').split()
+                length = int(length)
+            except ValueError:
+                raise ValueError("Bad request header %r" % (header,))
+            if source != 'auto' and source not in IMPORTERS:
+                raise ValueError("Unknown type %r" % (source,))
+            if length > self.max_size:
+                raise ValueError("Statement larger than %d bytes"
+                                 % (self.max_size,))
+            async with self.semaphore:
+                data = await reader.readexactly(length)
+                await self.convert(source, data, writer)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            writer.write(("!Error: %s\n" % (e,)).encode('utf-8'))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def produce(self, source, data, sink):
+        """Converts statement in worker thread, QIF goes to the sink"""
+        try:
+            if source == 'auto':
+                source, data = detect_importer(data)
+            with QIFWriter(sink, batch_size=self.batch_size) as qif:
+                qif.write_all(IMPORTERS[source](data))
+        except Exception as e:
+            if not sink.cancelled:
+                sink.put(("!Error: %s: %s\n" % (e.__class__.__name__, e))
+                         .encode('utf-8'))
+        finally:
+            if not sink.cancelled:
+                sink.put(None)
+
+    async def convert(self, source, data, writer):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        sink = _QueueSink(queue, loop)
+        producer = loop.run_in_executor(self.executor, self.produce, source,
+                                        data, sink)
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        except ConnectionError:
+            # Unblock the producer and let it finish
+            sink.cancelled = True
+            while not producer.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.sleep(0.01)
+            raise
+        finally:
+            await producer
 
 
 if __name__ == "__main__":
+    import argparse
     sources = sorted(IMPORTERS.keys())
 
     parser = argparse.ArgumentParser(
         description='Bank statement to QIF file converter')
     parser.add_argument('-i', '--input',
                         help='input file to process [default:stdin]',
-                        default='/dev/stdin')
+                        default='-')
     parser.add_argument('-o', '--output',
                         help='output file [default:stdout]',
-                        default='/dev/stdout')
+                        default='-')
+    parser.add_argument('-f', '--format',
+                        help='format of the output [default:qif]',
+                        choices=sorted(EXPORTERS.keys()),
+                        default='qif')
     parser.add_argument('-t', '--type',
-                        help='Type of input file [default:mbank]',
-                        choices=sources,
+                        help='Type of input file, "auto" detects it from '
+                             'the beginning of the file [default:mbank]',
+                        choices=sources + ['auto'],
                         default='mbank')
+    parser.add_argument('-b', '--batch', metavar='SOURCE',
+                        help='convert many files at once; SOURCE is a '
+                             'directory, glob pattern or manifest file with '
+                             '"file;type" lines')
+    parser.add_argument('-m', '--merge', action='store_true',
+                        help='in batch mode merge all transactions into the '
+                             'single output file')
+    parser.add_argument('-d', '--output-dir',
+                        help='in batch mode write output files into this '
+                             'directory [default:next to input files]')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes in batch mode or '
+                             'concurrent conversions of the service '
+                             '[default:number of available cores]')
+    parser.add_argument('-p', '--parallel', action='store_true',
+                        help='split the input into chunks and parse them '
+                             'in --jobs processes')
+    parser.add_argument('--incremental', metavar='STATE',
+                        help='convert only transactions added to the '
+                             'statement since the last run, watermarks are '
+                             'kept in STATE file')
+    parser.add_argument('--account',
+                        help='name of the account for --incremental '
+                             '[default:path of the input file]')
+    parser.add_argument('--dedup', metavar='INDEX',
+                        help='leave out transactions converted before, '
+                             'they are remembered in INDEX database')
+    parser.add_argument('--reconcile', choices=['fail', 'warn'],
+                        help='check transactions against opening and '
+                             'closing balance of the statement and fail or '
+                             'warn when they differ')
+    parser.add_argument('--rules', metavar='FILE',
+                        help='assign categories and payees by rules from '
+                             'FILE with "pattern<TAB>category[<TAB>payee]" '
+                             'lines, "re:" starts regular expression')
+    parser.add_argument('--ledger-balance', metavar='AMOUNT',
+                        help='closing balance for OFX output of statements '
+                             'which don\'t state it [default:0.00 with a '
+                             'warning]')
+    parser.add_argument('--on-error', choices=ErrorPolicy.modes,
+                        default='strict',
+                        help='what to do with records which can\'t be '
+                             'converted: stop, skip them reporting to '
+                             'stderr or also write them to quarantine file '
+                             '[default:strict]')
+    parser.add_argument('--quarantine', metavar='FILE',
+                        help='quarantine file for --on-error quarantine '
+                             '[default:output file with .rejected suffix]')
+    parser.add_argument('--resume', action='store_true',
+                        help='keep checkpoints in output file with '
+                             '.checkpoint suffix and continue from the last '
+                             'one when run again after a failure')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help='run as a service converting statements sent '
+                             'to HOST:PORT or Unix socket path')
+    parser.add_argument('-c', '--cache', metavar='DIR',
+                        help='cache parsed statements in this directory and '
+                             'reuse them for unchanged inputs')
+    parser.add_argument('--cache-size', type=int, default=256, metavar='MB',
+                        help='maximum size of the cache [default:256]')
+    parser.add_argument('-s', '--stats', action='store_true',
+                        help='print time spent in conversion stages and '
+                             'counters to stderr')
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help='write conversion stats as JSON to FILE')
+    parser.add_argument('--profile', action='store_true',
+                        help='sample running code and add hot spots to the '
+                             'stats')
     args = parser.parse_args()
-    importer_class = IMPORTERS.get(args.type)
-    importer = importer_class(args.input)
-    write_qif(args.output, importer)
+    stats = None
+    if args.stats or args.stats_json or args.profile:
+        stats = Stats()
+        if args.profile:
+            stats.profiler = SamplingProfiler()
+    if args.serve:
+        import asyncio
+        server = ConversionServer(jobs=args.jobs)
+        try:
+            asyncio.run(server.serve_forever(args.serve))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    cache = None
+    if args.cache:
+        cache = ParseCache(args.cache, args.cache_size << 20)
+    dedup = None
+    if args.dedup:
+        dedup = DedupIndex(args.dedup)
+    if args.ledger_balance:
+        if args.batch:
+            parser.error("--ledger-balance works only for conversion of a "
+                         "single statement")
+        try:
+            OFXExporter.ledger_balance = normalize_num(args.ledger_balance)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.resume:
+        if args.batch or args.incremental:
+            parser.error("--resume works only for conversion of a single "
+                         "statement")
+        if args.input == '-' or args.output == '-':
+            parser.error("--resume needs input and output files")
+        if not EXPORTERS[args.format].appendable:
+            parser.error("--resume can't continue %s output" % (args.format,))
+        if dedup is not None:
+            # Index may already hold transactions written after the last
+            # checkpoint
+            parser.error("--resume can't be combined with --dedup")
+        if args.parallel:
+            parser.error("--resume can't be combined with --parallel")
+        if args.reconcile:
+            # Records before the checkpoint are skipped, so the totals
+            # wouldn't match the balances
+            parser.error("--resume can't be combined with --reconcile")
+    if args.batch:
+        if dedup is not None and not args.merge:
+            parser.error("--dedup works only with --merge in batch mode")
+        if args.quarantine:
+            parser.error("Batch mode quarantines every input to its own "
+                         "file next to the output")
+        # Outputs of previous runs can be next to the inputs, but CSV is
+        # a statement format as well
+        skip = tuple(exporter.extension for exporter in EXPORTERS.values()
+                     if exporter.extension != '.csv')
+        jobs = collect_batch_inputs(args.batch, args.type,
+                                    skip + ('.rejected', '.checkpoint'))
+        try:
+            batch_outputs(jobs, args.output_dir,
+                          EXPORTERS[args.format].extension, args.merge,
+                          args.on_error != 'strict')
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            results = run_batch(jobs,
+                                output=args.output if args.merge else None,
+                                output_dir=args.output_dir,
+                                processes=args.jobs,
+                                cache=cache,
+                                dedup=dedup,
+                                output_format=args.format,
+                                reconcile=args.reconcile,
+                                rules=args.rules,
+                                on_error=args.on_error)
+        except BaseException:
+            if dedup is not None:
+                dedup.discard()
+            raise
+        if dedup is not None:
+            dedup.close()
+        sys.exit(1 if any(result.error for result in results) else 0)
+    infile = args.input
+    source = args.type
+    if source == 'auto':
+        source, infile = detect_importer(infile)
+    checkpoint = None
+    if args.resume:
+        checkpoint = Checkpoint(args.output + '.checkpoint', args.input,
+                                source)
+        try:
+            if checkpoint.load():
+                sys.stderr.write("Resuming after %d transactions\n"
+                                 % checkpoint.transactions)
+        except ValueError as e:
+            sys.exit("Error: %s" % (e,))
+    errors = None
+    if args.on_error != 'strict':
+        quarantine = args.quarantine
+        if args.on_error == 'quarantine' and quarantine is None:
+            if args.output == '-':
+                parser.error("--on-error quarantine needs --quarantine "
+                             "when writing to stdout")
+            quarantine = args.output + '.rejected'
+        errors = ErrorPolicy(args.on_error, quarantine, stats=stats,
+                             quarantine_size=checkpoint and
+                             checkpoint.quarantine_size or 0)
+        if checkpoint is not None:
+            checkpoint.errors = errors
+    if args.incremental:
+        if args.reconcile:
+            parser.error("--reconcile can't check incremental conversion")
+        store = WatermarkStore(args.incremental)
+        account = args.account or os.path.abspath(args.input)
+        transactions, watermark = incremental_transactions(
+            open_input(infile).read(), source, store.get(account), errors)
+        if args.rules:
+            transactions = load_rules(args.rules).categorize(transactions)
+        write_transactions(args.output, transactions, stats, args.format,
+                           statement=IMPORTERS[source])
+        store.set(account, watermark)
+        store.save()
+        if errors is not None:
+            errors.close()
+            if errors.rejected:
+                sys.stderr.write("Rejected records: %d\n" % errors.rejected)
+        sys.exit(0)
+    parallel = None
+    if args.parallel:
+        parallel = args.jobs or available_cpus()
+    if checkpoint is not None:
+        # Positions are known only by the importer itself
+        cache = None
+    transactions = load_transactions(infile, source, cache, stats, parallel,
+                                     args.reconcile, errors)
+    statement = statement_of(transactions, source)
+    output = args.output
+    if checkpoint is not None:
+        transactions = checkpoint.track(transactions)
+        output = open_truncated(args.output, checkpoint.output_size)
+    if dedup is not None:
+        transactions = deduplicate(transactions, dedup)
+    if args.rules:
+        transactions = load_rules(args.rules).categorize(transactions)
+    try:
+        write_transactions(output, transactions, stats, args.format,
+                           checkpoint, statement)
+    except BaseException as e:
+        if dedup is not None:
+            # Output is incomplete, so the transactions weren't converted
+            dedup.discard()
+        if isinstance(e, ReconciliationError):
+            sys.exit("Error: %s" % (e,))
+        raise
+    if checkpoint is not None:
+        output.close()
+        checkpoint.remove()
+    if errors is not None:
+        errors.close()
+        if errors.rejected:
+            sys.stderr.write("Rejected records: %d\n" % errors.rejected)
+    if dedup is not None:
+        dedup.close()
+    if args.stats or args.profile:
+        stats.report(sys.stderr)
+    if args.stats_json:
+        import json
+        with open(args.stats_json, 'w') as stats_file:
+            json.dump(stats.as_dict(), stats_file, indent=2)
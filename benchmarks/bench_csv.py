@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark of CSV reading in positional importers
+
+Rows of synthetic Unicredit, Zuno and SlSp statements are read the way
+the removed unicode_csv_reader did it (every decoded line encoded to
+UTF-8 and every cell decoded back, as it worked under Python 2) and by
+csv_rows() picking the used columns with itemgetter. Time of the whole
+conversion by the importer is reported as well.
+
+$ python3 benchmarks/bench_csv.py [rows]
+"""
+
+import codecs
+import csv
+import io
+import operator
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import bank2qif  # noqa: E402
+from generators import generate  # noqa: E402
+
+SOURCES = ['slsp', 'unicredit', 'zuno']
+
+
+def legacy_rows(data, encoding):
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding=encoding)
+    encoded = (line.encode('utf-8') for line in lines)
+    decode = codecs.getdecoder('utf-8')
+    for row in csv.reader((decode(line)[0] for line in encoded),
+                          delimiter=';'):
+        yield [decode(cell.encode('utf-8'))[0] for cell in row]
+
+
+def native_rows(data, importer_class):
+    columns = importer_class.used_columns
+    get = operator.itemgetter(*columns)
+    for row in importer_class(data).csv_rows():
+        if len(row) > max(columns):
+            yield get(row)
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    count = sum(1 for _ in func(*args))
+    return count, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("%-10s %9s %10s %10s %10s %10s"
+          % ('importer', 'rows', 'legacy/s', 'native/s', 'speedup',
+             'convert/s'))
+    for source in SOURCES:
+        importer_class = bank2qif.IMPORTERS[source]
+        data = generate(source, rows)
+        count, legacy = measure(legacy_rows, data,
+                                importer_class.input_encoding)
+        _, native = measure(native_rows, data, importer_class)
+        converted, convert = measure(importer_class, data)
+        print("%-10s %9d %10.0f %10.0f %9.2fx %10.0f"
+              % (source, count, count / legacy, count / native,
+                 legacy / native, converted / convert))
+
+
+if __name__ == "__main__":
+    main()
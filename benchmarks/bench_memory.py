@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare memory needed to keep a year of transactions around
+
+Plain __dict__ based objects (the way TransactionData used to be),
+__slots__ based TransactionData and TransactionBatch are measured with
+tracemalloc.
+
+$ python3 benchmarks/bench_memory.py [transactions]
+"""
+
+import os
+import sys
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from bank2qif import TransactionBatch, TransactionData  # noqa: E402
+
+
+class DictTransactionData(object):
+    def __init__(self, date=None, amount=None, destination=None,
+                 message=None, ident=None):
+        self.date = date
+        self.amount = amount
+        self.destination = destination
+        self.message = message.strip()
+        self.ident = ident
+        self.splits = []
+
+
+def generate(cls, count):
+    start = date(2023, 1, 1)
+    for i in range(count):
+        # Strings are built per row like the importers do
+        yield cls(start + timedelta(days=i % 365),
+                  -(i % 100000),
+                  destination="%s/%s" % ("123456789", "0800"),
+                  message="PLATBA KARTOU %s" % ("OBCHOD %d" % (i % 200)),
+                  ident="%013d" % i)
+
+
+def measure(build, count):
+    tracemalloc.start()
+    data = build(count)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    variants = [
+        ("dict objects", lambda n: list(generate(DictTransactionData, n))),
+        ("TransactionData", lambda n: list(generate(TransactionData, n))),
+        ("TransactionBatch",
+         lambda n: TransactionBatch(generate(TransactionData, n))),
+    ]
+    reference = None
+    for name, build in variants:
+        size = measure(build, count)
+        reference = reference or size
+        print("%-18s %8.1f MB %6.1f B/transaction %5.1f%%"
+              % (name, size / 1e6, size / count, 100.0 * size / reference))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of field normalization for every importer
+
+Rows resembling the fields each importer normalizes are run through the
+previous regular expression based normalize_field and the current one.
+
+$ python3 benchmarks/bench_normalize.py [rows]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import bank2qif  # noqa: E402
+
+multispace_re = re.compile(r'\s+')
+
+
+def regex_normalize_field(text):
+    ret = re.sub(multispace_re, " ", text)
+    return ret.replace('"', '').replace("'", "").strip()
+
+
+SHOPS = ['ALBERT HYPERMARKET  PRAHA', '"TESCO" STORES CR a.s.',
+         'Lidl   Ceska republika', "O'Neill's Pub  ", 'DM DROGERIE MARKT']
+
+# Fields normalized per row by the particular importer
+FIELDS = {
+    'mbank': lambda i: ['PLATBA KARTOU  ', 'Nákup %s' % SHOPS[i % 5],
+                        SHOPS[i % 5], '670100-22%08d/6210' % (i % 50)],
+    'airbank': lambda i: ['Platba kartou', '', SHOPS[i % 5],
+                          '%010d/3030' % (i % 50)],
+    'kb': lambda i: ['%02d.01.2024  %d,00 CZ' % (i % 28 + 1, i % 900),
+                     'PLATBA KARTOU', 'Nákup', SHOPS[i % 5],
+                     'PLATEBNÍ KARTY EC/MC CZK', 'PLATEBNÍ KARTY EC/MC CZK'],
+    'csob': lambda i: ['Transakce platební kartou', SHOPS[i % 5], '', ''],
+    'mbank-html': lambda i: [' \n  %s \n  DATUM  %02d.01.2024 '
+                             % (SHOPS[i % 5], i % 28 + 1)],
+    'unicredit': lambda i: ['UNICREDIT BANK', ' CZ', '%010d' % (i % 50),
+                            SHOPS[i % 5], 'PLATBA PLATEBNÍ KARTOU', '', '',
+                            '', '', '', SHOPS[i % 5]],
+    'zuno': lambda i: ['%010d' % (i % 50), '1111 ', SHOPS[i % 5]],
+    'slsp': lambda i: ['%010d' % (i % 50), '000019', '0900', SHOPS[i % 5],
+                       'Platba', 'VS %d' % i, 'Poznámka', ''],
+}
+
+
+def run(rows, normalize):
+    for row in rows:
+        for field in row:
+            normalize(field)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("%-12s %12s %12s %8s" % ('importer', 'regex [s]', 'current [s]',
+                                   'speedup'))
+    for name, fields in sorted(FIELDS.items()):
+        rows = [fields(i) for i in range(count)]
+        bank2qif.normalize_field.cache_clear()
+        old = min(timeit.repeat(lambda: run(rows, regex_normalize_field),
+                                number=1, repeat=3))
+        new = min(timeit.repeat(lambda: run(rows, bank2qif.normalize_field),
+                                number=1, repeat=3))
+        print("%-12s %12.3f %12.3f %7.1fx" % (name, old, new, old / new))
+
+
+if __name__ == "__main__":
+    main()
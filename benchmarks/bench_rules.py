@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark of rule-based categorization
+
+Transactions of a synthetic RB statement are categorized by synthetic
+rules (substrings and some regular expressions, the matching ones at the
+end) once by trying the rules one by one and once by Categorizer, both
+with and without its cache of distinct texts.
+
+$ python3 benchmarks/bench_rules.py [rows] [literals] [regexes]
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import bank2qif  # noqa: E402
+from generators import SHOPS, generate  # noqa: E402
+
+
+def make_rules(literals, regexes, rnd):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    rules = []
+    for i in range(literals):
+        word = ''.join(rnd.choice(letters) for _ in range(rnd.randint(5, 12)))
+        rules.append((word, 'Literal %d' % i, None))
+    for i in range(regexes):
+        word = ''.join(rnd.choice(letters) for _ in range(rnd.randint(3, 6)))
+        rules.append(('re:%s\\d{2,}[a-z]+' % word, 'Regex %d' % i, None))
+    for shop in SHOPS:
+        rules.append((shop.split()[0], 'Shops', shop))
+    rules.append((r're:\d+/0800', 'Savings bank', None))
+    return rules
+
+
+def naive(rules, texts):
+    compiled = []
+    for pattern, category, payee in rules:
+        if pattern.startswith('re:'):
+            compiled.append((re.compile(pattern[3:], re.I | re.S).search,
+                             None, category, payee))
+        else:
+            compiled.append((None, pattern.casefold(), category, payee))
+    result = []
+    for text in texts:
+        folded = text.casefold()
+        found = None
+        for search, literal, category, payee in compiled:
+            if (search(text) if search is not None else literal in folded):
+                found = (category, payee)
+                break
+        result.append(found)
+    return result
+
+
+def indexed(rules, texts, cache_size):
+    categorizer = bank2qif.Categorizer(rules, cache_size=cache_size)
+    return [categorizer.match(text) for text in texts]
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    literals = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    regexes = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    rules = make_rules(literals, regexes, random.Random(0))
+    texts = [u"%s\n%s" % (t.destination or u'', t.message or u'')
+             for t in bank2qif.IMPORTERS['rb'](generate('rb', rows))]
+
+    expected, one_by_one = measure(naive, rules, texts)
+    print("%-12s %9.0f rows/s" % ('one by one', len(texts) / one_by_one))
+    for name, cache_size in (('uncached', 0), ('cached', 65536)):
+        result, elapsed = measure(indexed, rules, texts, cache_size)
+        assert result == expected, name
+        print("%-12s %9.0f rows/s %8.1fx"
+              % (name, len(texts) / elapsed, one_by_one / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Startup time of bank2qif in fresh interpreters
+
+Measured are importing the module, converting a small Fio statement when
+run as a module (bytecode cached) and as a script (compiled on every
+run), all relative to an empty interpreter. Modules which are supposed
+to be imported only when needed are reported if importing bank2qif
+loads them.
+
+$ python3 benchmarks/bench_startup.py --save startup.json
+$ python3 benchmarks/bench_startup.py --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from generators import generate  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Must not be imported by plain "import bank2qif"
+LAZY_MODULES = ['argparse', 'asyncio', 'concurrent.futures', 'decimal',
+                'glob', 'hashlib', 'json', 'multiprocessing', 'signal',
+                'sqlite3', 'xml.etree.ElementTree']
+
+
+def run_time(command, repeat):
+    """Returns the best wall time of command in ms"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    # Startup without cached bytecode is not what users see
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    subprocess.run(command, env=env, cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loaded_lazy_modules():
+    code = ("import sys, bank2qif; print(' '.join(m for m in %r "
+            "if m in sys.modules))" % (LAZY_MODULES,))
+    output = subprocess.check_output([sys.executable, '-c', code],
+                                     env=dict(os.environ, PYTHONPATH=ROOT),
+                                     cwd=ROOT)
+    return output.decode().split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-r', '--repeat', type=int, default=20,
+                        help='runs of every command [default:20]')
+    parser.add_argument('-s', '--save', metavar='FILE',
+                        help='store results as baseline to FILE')
+    parser.add_argument('-b', '--baseline', metavar='FILE',
+                        help='compare results with baseline from FILE')
+    parser.add_argument('--tolerance', type=float, default=20.0,
+                        help='regression threshold in %% [default:20]')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.gpc') as statement:
+        statement.write(generate('fio', 10))
+        statement.flush()
+        python = sys.executable
+        convert = ['-t', 'fio', '-i', statement.name, '-o', os.devnull]
+        interpreter = run_time([python, '-c', 'pass'], args.repeat)
+        results = {
+            'import': run_time([python, '-c', 'import bank2qif'],
+                               args.repeat) - interpreter,
+            'module': run_time([python, '-m', 'bank2qif'] + convert,
+                               args.repeat) - interpreter,
+            'script': run_time([python, os.path.join(ROOT, 'bank2qif.py')] +
+                               convert, args.repeat) - interpreter,
+        }
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    failed = False
+    print("interpreter %7.1f ms" % interpreter)
+    for name, value in sorted(results.items()):
+        line = "%-11s %7.1f ms" % (name, value)
+        old = baseline.get(name)
+        if old:
+            change = (value - old) / old
+            line += " %+6.1f%%" % (change * 100)
+            if change > args.tolerance / 100.0:
+                failed = True
+                line += " regression"
+        print(line)
+    loaded = loaded_lazy_modules()
+    if loaded:
+        failed = True
+        print("imported eagerly: %s" % ' '.join(loaded))
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Synthetic statements in formats of all registered importers
+
+Every generator takes number of transactions and returns content of the
+statement as bytes in the encoding the importer expects.
+
+>>> data = generate('fio', 1000)
+"""
+
+import random
+from datetime import date, timedelta
+
+SHOPS = ['ALBERT HYPERMARKET PRAHA', 'TESCO STORES CR a.s.',
+         'Lidl Ceska republika', 'DM DROGERIE MARKT', 'Kavárna U Čížka',
+         'BENZINA PLUS', 'Lékárna Dr. Max', 'IKEA Zličín']
+MESSAGES = ['Nájem', 'Platba za elektřinu', 'Výplata', 'Splátka úvěru',
+            'Příspěvek na dovolenou', 'Vrácení přeplatku', '', 'Dárek']
+BANK_CODES = ['0100', '0300', '0800', '2010', '5500', '6210']
+
+GENERATORS = {}
+
+
+def generator(source):
+    def f(func):
+        GENERATORS[source] = func
+        return func
+    return f
+
+
+def generate(source, count, seed=0):
+    return GENERATORS[source](count, random.Random(seed))
+
+
+def transactions(count, rnd):
+    """Yields (date, amount in cents, shop, message, account, bank code)"""
+    start = date(2023, 1, 1)
+    for i in range(count):
+        yield (start + timedelta(days=i * 365 // max(count, 1)),
+               rnd.randint(-5000000, 3000000),
+               rnd.choice(SHOPS),
+               rnd.choice(MESSAGES),
+               '%d' % rnd.randint(10000, 99999999),
+               rnd.choice(BANK_CODES))
+
+
+def czech_amount(amount):
+    """Formats cents as '-1 234,56'"""
+    sign = '-' if amount < 0 else ''
+    whole, cents = divmod(abs(amount), 100)
+    return '%s%s,%02d' % (sign, '{:,}'.format(whole).replace(',', ' '), cents)
+
+
+def crlf(lines, encoding):
+    return ('\r\n'.join(lines) + '\r\n').encode(encoding)
+
+
+@generator('mbank')
+def mbank(count, rnd):
+    lines = ['mBank S.A., organizační složka;', '#Klient:;', 'Jan Novák;',
+             '', '#Za období:;', '01.01.2023;31.12.2023;', '',
+             '#Počáteční zůstatek:;0,00 CZK;', '',
+             '#Datum uskutečnění transakce;#Datum zaúčtování transakce;'
+             '#Popis transakce;#Zpráva pro příjemce;#Plátce/Příjemce;'
+             '#Číslo účtu plátce/příjemce;#KS;#VS;#SS;#Částka transakce;'
+             '#Účetní zůstatek po transakci;']
+    balance = 0
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        if rnd.random() < 0.5:
+            message = '%s  DATUM PROVEDENÍ TRANSAKCE: %s' % (shop, tdate)
+        balance += amount
+        lines.append('%s;%s;"PLATBA KARTOU";"%s";"%s";"%s/%s";;;;%s;%s;'
+                     % (tdate.strftime('%d-%m-%Y'), tdate.strftime('%d-%m-%Y'),
+                        message, shop, account, bank, czech_amount(amount),
+                        czech_amount(balance)))
+    lines += ['', '#Konečný zůstatek:;%s CZK;' % czech_amount(balance)]
+    return crlf(lines, 'cp1250')
+
+
+@generator('airbank')
+def airbank(count, rnd):
+    lines = ['"Datum provedení";"Směr úhrady";"Typ úhrady";'
+             '"Pojmenování příkazu";"Název účtu protistrany";'
+             '"Číslo účtu protistrany";"Částka v měně účtu";'
+             '"Poznámka k platbě"']
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        lines.append('"%s";"Odchozí";"Platba kartou";"%s";"%s";"%s/%s";'
+                     '"%s";"%s"'
+                     % (tdate.strftime('%d/%m/%Y'), shop, shop, account, bank,
+                        czech_amount(amount).replace(' ', ''), message))
+    return crlf(lines, 'cp1250')
+
+
+@generator('kb')
+def kb(count, rnd):
+    lines = ['"Datum vytvoření souboru";"01.01.2024";', '',
+             '"Datum splatnosti";"Datum odepsání z jiné banky";"Protiúčet";'
+             '"Název protiúčtu";"Částka";"Popis příkazce";"AV pole 1";'
+             '"AV pole 2";"AV pole 3";"AV pole 4"']
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        card = rnd.random() < 0.5
+        lines.append('"%s";"";"%s/%s";"%s";"%s";"%s";"%s";"%s";"%s";"%s"'
+                     % (tdate.strftime('%d.%m.%Y'), account, bank,
+                        'PLATEBNÍ KARTY EC/MC CZK' if card else shop,
+                        czech_amount(amount).replace(' ', ''), shop,
+                        'PLATBA KARTOU' if card else '', message, shop,
+                        '%s  %d,00 CZ' % (tdate.strftime('%d.%m.%Y'),
+                                          rnd.randint(1, 999))
+                        if card else ''))
+    return crlf(lines, 'cp1250')
+
+
+@generator('csob')
+def csob(count, rnd):
+    lines = ['Historie transakcí', '', 'číslo účtu: 123456789/0300', '']
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        lines += ['datum zaúčtování: %s' % tdate.strftime('%d.%m.%Y'),
+                  'částka: %s' % czech_amount(amount),
+                  'měna: CZK',
+                  'označení operace: Transakce platební kartou',
+                  'protiúčet: %s/%s' % (account, bank),
+                  'název protiúčtu: %s' % shop,
+                  'poznámka: %s' % message,
+                  '']
+    return crlf(lines, 'cp1250')
+
+
+@generator('mbank-html')
+def mbank_html(count, rnd):
+    parts = ['<html><head><title>mBank - výpis</title></head><body>']
+    parts += ['<table><tr><td>mBank</td></tr></table>'] * 5
+    parts.append('<table><tr><td>Výpis</td></tr>'
+                 '<tr><td>#</td><td>Datum</td><td>Popis</td>'
+                 '<td>Částka</td></tr>')
+    for i, (tdate, amount, shop, message, account, bank) in enumerate(
+            transactions(count, rnd)):
+        amount = czech_amount(amount).replace(' ', '.')
+        parts.append('<tr><td>%d</td><td><nobr>%s</nobr></td>'
+                     '<td><nobr>%s</nobr></td><td><b>PLATBA KARTOU</b><br/>'
+                     '%s <i>%s</i></td><td><nobr>%s</nobr></td></tr>'
+                     % (i, tdate.strftime('%d.%m.%Y'),
+                        tdate.strftime('%d.%m.%Y'), shop, message, amount))
+    parts.append('<tr><td>Celkem</td></tr></table></body></html>')
+    return '\n'.join(parts).encode('iso-8859-2')
+
+
+@generator('unicredit')
+def unicredit(count, rnd):
+    lines = ['Pohyby na účtu;', 'Účet;Částka;Měna;Datum zaúčtování;'
+             'Valuta;Banka;Název banky;Název banky;Číslo účtu;Název účtu;'
+             'Adresa;Adresa;Adresa;Detaily transakce;Detaily transakce;'
+             'Detaily transakce;Detaily transakce;Detaily transakce;'
+             'Detaily transakce;KS;VS;SS']
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        card = rnd.random() < 0.5
+        lines.append('123456789;%s;CZK;%s;%s;%s;%s;%s;%s;%s;;;;%s;%s;;;;%s;'
+                     '0308;;'
+                     % (czech_amount(amount).replace(' ', ''), tdate, tdate,
+                        bank, 'BANKA', 'CZ', '' if card else account,
+                        '' if card else shop,
+                        'PLATBA PLATEBNÍ KARTOU' if card else 'PLATBA',
+                        message, shop if card else ''))
+    lines.append('')
+    return crlf(lines, 'utf-8')
+
+
+@generator('zuno')
+def zuno(count, rnd):
+    lines = ['Výpis z účtu;', 'Dátum transakcie:;Typ;Popis;Číslo účtu;'
+             'Kód banky;Správa;Suma;Mena']
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        lines.append('%s;Platba;%s;%s;%s;%s;%s;EUR'
+                     % (tdate.strftime('%d.%m.%Y'), shop, account, bank,
+                        message or shop,
+                        czech_amount(amount).replace(' ', '')))
+    lines.append('')
+    return crlf(lines, 'utf-8')
+
+
+@generator('fio')
+def fio(count, rnd):
+    lines = []
+    total = 0
+    for i, (tdate, amount, shop, message, account, bank) in enumerate(
+            transactions(count, rnd)):
+        total += amount
+        lines.append('075%016d%016d%013d%012d%d%010d%010d%010d%s%-20s00203%s'
+                     % (2000000001, int(account), 1000000 + i, abs(amount),
+                        1 if amount < 0 else 2, rnd.randint(0, 9999999),
+                        int(bank), 0, tdate.strftime('%d%m%y'),
+                        (message or shop)[:20], tdate.strftime('%d%m%y')))
+    # Balances add up, the turnovers are left empty
+    lines.insert(0, '074%016d%-20s311222%014d+%014d%s%014d0%014d0001311223%14s'
+                 % (2000000001, 'Jan Novak', 0, abs(total),
+                    '-' if total < 0 else '+', 0, 0, ''))
+    return crlf(lines, 'cp1250')
+
+
+@generator('rb')
+def rb(count, rnd):
+    delimiter = '=' * 86
+    lines = ['Raiffeisenbank a.s.', delimiter, 'Výpis z účtu', delimiter,
+             'Za období 1.1.2023 - 31.12.2023', delimiter,
+             'Datum  Popis                 ' + ' ' * 22 + 'Částka  Poplatek',
+             delimiter, '', delimiter]
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        fee = rnd.choice([0, 0, 0, 500])
+        lines.append('     %s%-22s%22s%21s %9s'
+                     % (tdate.strftime('%d.%m.'), shop[:22], '',
+                        czech_amount(amount), czech_amount(-fee)))
+        lines.append('           %-22s' % ('%s/%s' % (account, bank)))
+        lines.append('           %-22s%43s %9s' % ('', '', '0,00'))
+        if message:
+            lines.append('           %s' % message)
+        lines.append('-' * 86)
+    return crlf(lines, 'cp1250')
+
+
+@generator('slsp')
+def slsp(count, rnd):
+    lines = []
+    for tdate, amount, shop, message, account, bank in transactions(count,
+                                                                     rnd):
+        lines.append('%s;%s;EUR;%s;%s;%s;%s;%s;;;;%s;;;;;%s;;%s;;;;%s;'
+                     % (tdate.strftime('%d.%m.%Y'), tdate.strftime('%d.%m.%Y'),
+                        '000019', account, bank, shop,
+                        czech_amount(amount).replace(' ', ''), shop,
+                        message, 'VS%d' % rnd.randint(1, 9999), ''))
+    lines.append('')
+    return crlf(lines, 'cp1250')
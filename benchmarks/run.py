@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark all registered importers on synthetic statements
+
+For every importer a statement with the given number of transactions is
+generated and converted in a separate process. Reported are rows/s and
+MB/s of the whole conversion, peak RSS of the process and time spent in
+the individual stages:
+
+ read       reading and decoding the statement file
+ parse      importer's __iter__ without field normalization
+ normalize  normalize_field calls made by the importer
+ write      rendering the QIF output
+
+$ python3 benchmarks/run.py --rows 100000 --save baseline.json
+$ python3 benchmarks/run.py --rows 100000 --baseline baseline.json
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import bank2qif  # noqa: E402
+from generators import generate  # noqa: E402
+
+METRICS = ['rows_per_s', 'mb_per_s', 'peak_rss_mb', 'read', 'parse',
+           'normalize', 'write']
+# Metrics where more is better
+HIGHER_IS_BETTER = {'rows_per_s', 'mb_per_s'}
+
+
+def record_normalize_calls(calls):
+    """Replaces normalize_field with version remembering its arguments"""
+    normalize_field = bank2qif.normalize_field
+
+    def recording_normalize_field(text):
+        calls.append(text)
+        return normalize_field(text)
+    bank2qif.normalize_field = recording_normalize_field
+    return normalize_field
+
+
+def benchmark(source, rows, path):
+    importer_class = bank2qif.IMPORTERS[source]
+    size = os.path.getsize(path)
+
+    start = time.perf_counter()
+    with open(path, 'rb') as statement:
+        io.TextIOWrapper(statement,
+                         encoding=importer_class.input_encoding).read()
+    read = time.perf_counter() - start
+
+    start = time.perf_counter()
+    transactions = list(importer_class(path))
+    total = time.perf_counter() - start
+
+    # Normalization is measured separately on recorded arguments, timing
+    # every call during the parse would distort it too much
+    calls = []
+    normalize_field = record_normalize_calls(calls)
+    list(importer_class(path))
+    bank2qif.normalize_field = normalize_field
+    normalize_field.cache_clear()
+    start = time.perf_counter()
+    for text in calls:
+        normalize_field(text)
+    normalize = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bank2qif.write_qif(io.BytesIO(), transactions)
+    write = time.perf_counter() - start
+
+    total += write
+    return {
+        'rows': len(transactions),
+        'rows_per_s': len(transactions) / total,
+        'mb_per_s': size / 1e6 / total,
+        'peak_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'read': read,
+        'parse': max(total - write - normalize, 0.0),
+        'normalize': normalize,
+        'write': write,
+    }
+
+
+def run_one(job):
+    source, rows, directory = job
+    path = os.path.join(directory, source)
+    with open(path, 'wb') as statement:
+        statement.write(generate(source, rows))
+    try:
+        return source, benchmark(source, rows, path)
+    except Exception as e:
+        return source, {'error': "%s: %s" % (e.__class__.__name__, e)}
+
+
+def compare(result, reference, tolerance):
+    """Returns list of metrics which got worse by more than tolerance"""
+    regressions = []
+    for metric in METRICS:
+        old = reference.get(metric)
+        new = result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if metric in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append((metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--rows', type=int, default=100000,
+                        help='transactions per statement [default:100000]')
+    parser.add_argument('-t', '--type', action='append',
+                        choices=sorted(bank2qif.IMPORTERS),
+                        help='benchmark only these importers')
+    parser.add_argument('-s', '--save', metavar='FILE',
+                        help='store results as baseline to FILE')
+    parser.add_argument('-b', '--baseline', metavar='FILE',
+                        help='compare results with baseline from FILE')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='regression threshold in %% [default:10]')
+    args = parser.parse_args()
+
+    sources = args.type or sorted(bank2qif.IMPORTERS)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    failed = False
+    print("%-11s %8s %10s %7s %8s %7s %7s %7s %7s"
+          % ('importer', 'rows', 'rows/s', 'MB/s', 'RSS MB', 'read',
+             'parse', 'norm', 'write'))
+    with tempfile.TemporaryDirectory() as directory:
+        # New process for every importer to get its own peak RSS
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            jobs = [(source, args.rows, directory) for source in sources]
+            for source, result in pool.imap(run_one, jobs):
+                results[source] = result
+                if 'error' in result:
+                    print("%-11s %s" % (source, result['error']))
+                    continue
+                print("%-11s %8d %10.0f %7.2f %8.1f %7.3f %7.3f %7.3f %7.3f"
+                      % (source, result['rows'], result['rows_per_s'],
+                         result['mb_per_s'], result['peak_rss_mb'],
+                         result['read'], result['parse'],
+                         result['normalize'], result['write']))
+                if source in baseline:
+                    regressions = compare(result, baseline[source],
+                                          args.tolerance / 100.0)
+                    for metric, change in regressions:
+                        failed = True
+                        print("%-11s regression of %s by %.1f%%"
+                              % ('', metric, change * 100))
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
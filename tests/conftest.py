@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Shared setup of the tests
+
+bank2qif and the statement generators of the benchmarks are imported from
+the checkout, the fixtures give small synthetic statements."""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import bank2qif  # noqa: E402
+from generators import generate  # noqa: E402
+
+
+@pytest.fixture(params=sorted(bank2qif.IMPORTERS))
+def statement(request, tmp_path):
+    """Source and path of a small synthetic statement"""
+    path = tmp_path / ('statement.' + request.param)
+    path.write_bytes(generate(request.param, 45))
+    return request.param, str(path)
+
+
+@pytest.fixture
+def qif():
+    """Returns function converting transactions to QIF bytes"""
+    def convert(transactions):
+        out = bytearray()
+        bank2qif.write_transactions(out, transactions)
+        return bytes(out)
+    return convert
+
+
+@pytest.fixture
+def cli(tmp_path):
+    """Returns function running bank2qif.py with arguments in tmp_path
+
+    The function returns the finished process with text output."""
+    import subprocess
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'bank2qif.py')] + list(args),
+            cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+    return run
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Tests of amounts in integer minor units"""
+
+from datetime import date
+
+import pytest
+
+import bank2qif
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('-1 234,56', -123456),
+    ('1 234,5', 123450),
+    ('+12,00', 1200),
+    ('0,07', 7),
+    ('-,5', -50),
+    ('1\xa0000', 100000),
+    ('1,005', 101),
+    ('-1,005', -101),
+    ('', None),
+    ('  ', None),
+])
+def test_normalize_num(text, expected):
+    assert bank2qif.normalize_num(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '--5', '+-5', '1.2.3', '1,2,3', 'x', '12 CZK', '-', ',', '1e5', '1,0x5',
+])
+def test_normalize_num_malformed(text):
+    with pytest.raises(ValueError):
+        bank2qif.normalize_num(text)
+
+
+@pytest.mark.parametrize('amount, expected', [
+    (0, '0.00'), (7, '0.07'), (-7, '-0.07'), (123456, '1234.56'),
+    (-123450, '-1234.50'),
+])
+def test_format_amount(amount, expected):
+    assert bank2qif.format_amount(amount) == expected
+
+
+def test_split_amounts():
+    transaction = bank2qif.TransactionData(date(2023, 1, 1), None)
+    for amount in ('0,10', '0,20', '-0,30', '1 000,01'):
+        transaction.add_split(bank2qif.SplitItem(
+            bank2qif.normalize_num(amount)))
+    assert transaction.get_amount() == 100001
+    assert bank2qif.format_amount(transaction.get_amount()) == '1000.01'
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Tests of TransactionBatch"""
+
+from datetime import date
+
+import bank2qif
+
+
+def test_batch_round_trip(statement, qif):
+    source, path = statement
+    expected = qif(bank2qif.IMPORTERS[source](path))
+    batch = bank2qif.TransactionBatch(bank2qif.IMPORTERS[source](path))
+    assert len(batch) == 45
+    assert qif(batch) == expected
+    assert qif(bank2qif.TransactionBatch.loads(batch.dumps())) == expected
+
+
+def test_batch_items():
+    transaction = bank2qif.TransactionData(date(2023, 7, 2), None,
+                                           destination='Albert',
+                                           message='Nákup', ident='42')
+    transaction.add_split(bank2qif.SplitItem(-10050, 'Jídlo'))
+    transaction.add_split(bank2qif.SplitItem(-1999))
+    batch = bank2qif.TransactionBatch([
+        bank2qif.TransactionData(date(2023, 1, 1), 1234, message='Nájem'),
+        transaction])
+    batch.append(bank2qif.TransactionData(date(2023, 12, 31), -1))
+    assert len(batch) == 3
+    first, second, third = batch.loads(batch.dumps())
+    assert (first.date, first.amount, first.message) == \
+        (date(2023, 1, 1), 1234, 'Nájem')
+    assert first.splits == [] and first.destination is None
+    assert (second.destination, second.ident) == ('Albert', '42')
+    assert second.get_amount() == -12049
+    assert [(s.amount, s.message) for s in second.splits] == \
+        [(-10050, 'Jídlo'), (-1999, None)]
+    assert (third.date, third.amount) == (date(2023, 12, 31), -1)
+    assert batch[-1].amount == -1
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Tests of batch conversion of many statements"""
+
+import io
+import os
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+@pytest.fixture
+def statements(tmp_path):
+    """Directory with mBank, Fio and KB statements"""
+    directory = tmp_path / 'in'
+    directory.mkdir()
+    for source in ('mbank', 'fio', 'kb'):
+        (directory / ('%s.%s' % (source, source))).write_bytes(
+            generate(source, 45))
+    return directory
+
+
+def converted(path, source):
+    out = bytearray()
+    bank2qif.write_transactions(out, bank2qif.IMPORTERS[source](str(path)))
+    return bytes(out)
+
+
+def test_collect_directory(statements):
+    (statements / 'kb.rejected').write_bytes(b'')
+    (statements / 'sub').mkdir()
+    jobs = bank2qif.collect_batch_inputs(str(statements), 'auto')
+    assert jobs == [(str(statements / name), 'auto')
+                    for name in ('fio.fio', 'kb.kb', 'mbank.mbank')]
+
+
+def test_collect_glob(statements):
+    jobs = bank2qif.collect_batch_inputs(str(statements / 'm*'), 'mbank')
+    assert jobs == [(str(statements / 'mbank.mbank'), 'mbank')]
+
+
+def test_collect_manifest(statements):
+    manifest = statements / 'manifest.txt'
+    manifest.write_text(u'# statements of May\n'
+                        u'fio.fio;fio\n'
+                        u'\n'
+                        u'kb.kb\n')
+    jobs = bank2qif.collect_batch_inputs(str(manifest), 'kb')
+    assert jobs == [(str(statements / 'fio.fio'), 'fio'),
+                    (str(statements / 'kb.kb'), 'kb')]
+
+    manifest.write_text(u'fio.fio;unknown\n')
+    with pytest.raises(ValueError):
+        bank2qif.collect_batch_inputs(str(manifest), 'kb')
+
+
+def test_outputs(tmp_path):
+    jobs = [('a/x.fio', 'fio'), ('b/y.kb', 'kb')]
+    assert bank2qif.batch_outputs(jobs, 'out', '.qif') == [
+        (os.path.join('out', 'x.qif'), None),
+        (os.path.join('out', 'y.qif'), None)]
+    assert bank2qif.batch_outputs(jobs, None, '.qif', merged=True,
+                                  errors=True) == [
+        (None, os.path.join('a', 'x.rejected')),
+        (None, os.path.join('b', 'y.rejected'))]
+
+    with pytest.raises(ValueError):
+        bank2qif.batch_outputs([('a/x.fio', 'fio'), ('b/x.kb', 'kb')],
+                               'out', '.qif')
+    with pytest.raises(ValueError):
+        bank2qif.batch_outputs([('a/x.qif', 'fio')], None, '.qif')
+
+
+def test_run(statements, tmp_path):
+    jobs = bank2qif.collect_batch_inputs(str(statements), 'auto')
+    jobs.append((str(statements / 'missing.mbank'), 'mbank'))
+    report = io.StringIO()
+    results = bank2qif.run_batch(jobs, output_dir=str(tmp_path / 'out'),
+                                 processes=2, report=report)
+
+    assert [result.infile for result in results] == [
+        infile for infile, _ in jobs]
+    for result in results[:3]:
+        assert result.error is None
+        assert result.count == 45
+        source = os.path.splitext(result.infile)[1][1:]
+        assert result.source == source
+        with open(result.outfile, 'rb') as output:
+            assert output.read() == converted(result.infile, source)
+    assert results[3].error.startswith('FileNotFoundError')
+    assert report.getvalue().splitlines()[-1].startswith(
+        '4 files (1 failed), 135 transactions')
+
+
+def test_run_merged(statements, tmp_path):
+    jobs = [(str(statements / 'mbank.mbank'), 'mbank'),
+            (str(statements / 'fio.fio'), 'fio')]
+    output = str(tmp_path / 'all.qif')
+    bank2qif.run_batch(jobs, output=output, processes=2,
+                       report=io.StringIO())
+    header = b'!Type:Bank\n'
+    expected = (converted(statements / 'mbank.mbank', 'mbank') +
+                converted(statements / 'fio.fio', 'fio')[len(header):])
+    with open(output, 'rb') as merged:
+        assert merged.read() == expected
+    assert sorted(os.listdir(str(statements))) == [
+        'fio.fio', 'kb.kb', 'mbank.mbank']
+
+
+def test_cli(cli, statements, tmp_path):
+    done = cli('-t', 'auto', '-b', 'in', '-j', '2')
+    assert done.returncode == 0, done.stderr
+    assert (statements / 'kb.qif').read_bytes() == converted(
+        statements / 'kb.kb', 'kb')
+
+    # Outputs of the first run aren't converted again
+    done = cli('-t', 'auto', '-b', 'in', '-j', '2')
+    assert done.returncode == 0, done.stderr
+    assert '3 files (0 failed)' in done.stderr
+
+    bad = generate('mbank', 45).replace(b'\r\n01-', b'\r\nxx-', 1)
+    (statements / 'bad.mbank').write_bytes(bad)
+    done = cli('-t', 'mbank', '-b', 'in/*.mbank', '-d', 'out')
+    assert done.returncode == 1
+    assert 'FAILED' in done.stderr
+    assert (tmp_path / 'out' / 'mbank.qif').exists()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Tests of the cache of parsed statements"""
+
+import marshal
+import os
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return bank2qif.ParseCache(str(tmp_path / 'cache'))
+
+
+def entries(cache):
+    return sorted(os.listdir(cache.directory))
+
+
+def test_cache_hit(cache, qif):
+    content = generate('kb', 45)
+    expected = qif(bank2qif.IMPORTERS['kb'](content))
+    first = bank2qif.load_transactions(content, 'kb', cache)
+    assert qif(first) == expected
+    assert len(entries(cache)) == 1
+    replayed = bank2qif.load_transactions(content, 'kb', cache)
+    assert isinstance(replayed, bank2qif.TransactionBatch)
+    assert qif(replayed) == expected
+
+
+def test_cache_keys(cache):
+    content = generate('kb', 10)
+    key = cache.key(bank2qif.IMPORTERS['kb'], content)
+    assert key != cache.key(bank2qif.IMPORTERS['kb'], content + b'\r\n')
+    assert key != cache.key(bank2qif.IMPORTERS['mbank'], content)
+
+
+@pytest.mark.parametrize('entry', [
+    b'', b'garbage', b'\xe9\x03\x00\x00',
+    # Valid marshal data of something else
+    b'\xe9\x03\x00\x00\x00',
+    # Columns of different lengths
+    marshal.dumps((b'', b'\x00' * 8, [None], [None], [None], {})),
+])
+def test_cache_corrupt_entry(cache, qif, entry):
+    content = generate('kb', 45)
+    expected = qif(bank2qif.IMPORTERS['kb'](content))
+    bank2qif.load_transactions(content, 'kb', cache)
+    path, = [os.path.join(cache.directory, name) for name in entries(cache)]
+    with open(path, 'wb') as damaged:
+        damaged.write(entry)
+    assert cache.get(os.path.basename(path)) is None
+    assert not os.path.exists(path)
+    assert qif(bank2qif.load_transactions(content, 'kb', cache)) == expected
+    with open(path, 'rb') as replaced:
+        assert replaced.read() != entry
+
+
+def test_cache_eviction(cache):
+    for seed in range(3):
+        content = generate('kb', 200, seed)
+        bank2qif.load_transactions(content, 'kb', cache)
+    size = sum(os.path.getsize(os.path.join(cache.directory, name))
+               for name in entries(cache))
+    cache.max_size = size // 2
+    cache.evict()
+    assert 0 < len(entries(cache)) < 3
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Tests of rule-based categorization"""
+
+from datetime import date
+
+import pytest
+
+import bank2qif
+
+
+def categorize(rules, text):
+    rule = bank2qif.Categorizer(rules).match(text)
+    return rule and rule[0]
+
+
+@pytest.mark.parametrize('rules, text, expected', [
+    ([('albert', 'Food', None)], 'ALBERT HYPERMARKET', 'Food'),
+    ([('albert', 'Food', None)], 'Lidl', None),
+    # First matching rule wins whatever kind it is
+    ([('tesco', 'Shop', None), ('re:tes.o', 'Regex', None)], 'TESCO',
+     'Shop'),
+    ([('re:tes.o', 'Regex', None), ('tesco', 'Shop', None)], 'TESCO',
+     'Regex'),
+    ([('re:\\d+/0800', 'Savings', None), ('0800', 'Bank', None)],
+     '123/0800', 'Savings'),
+    # Later rule matching earlier in the text doesn't win
+    ([('re:world', 'A', None), ('re:hello', 'B', None)], 'hello world',
+     'A'),
+    ([('re:prefixed\\d+', 'A', None), ('re:\\d+', 'B', None)],
+     'prefixed 12', 'B'),
+    ([('re:prefixed\\d+', 'A', None), ('re:\\d+', 'B', None)],
+     'prefixed12', 'A'),
+])
+def test_first_rule_wins(rules, text, expected):
+    assert categorize(rules, text) == expected
+
+
+@pytest.mark.parametrize('pattern, text', [
+    ('re:x*', 'abc'),
+    ('re:(foo)?', 'abc'),
+    ('re:^$', ''),
+    ('re:.*', 'abc'),
+    ('re:$', 'abc'),
+])
+def test_empty_match(pattern, text):
+    rules = [('never', 'Literal', None), ('re:never\\d', 'Regex', None),
+             (pattern, 'Empty', None), ('re:abc', 'Later', None)]
+    assert categorize(rules, text) == 'Empty'
+
+
+@pytest.mark.parametrize('pattern, text, expected', [
+    # Backreference to its own group
+    ('re:(a)\\1', 'xaa', 'Separate'),
+    ('re:(a)\\1', 'xab', 'Other'),
+    ('re:(?P<letter>a)(?P=letter)', 'xaa', 'Separate'),
+    # Inline flags apply to the expression only
+    ('re:(?x) a b c', 'abc', 'Separate'),
+    ('re:(?x) a b c', 'a b c', 'Other'),
+])
+def test_separate_expressions(pattern, text, expected):
+    rules = [('re:zz+', 'Combined', None), (pattern, 'Separate', None),
+             ('re:[a-z]', 'Other', None)]
+    assert categorize(rules, text) == expected
+
+
+@pytest.mark.parametrize('pattern, combinable', [
+    ('ab+c', True),
+    ('(a|b)c', True),
+    ('(?:a)(?i:b)', True),
+    ('[\\d]+', True),
+    ('(a)\\1', False),
+    ('(?P<x>a)', False),
+    ('(?P<x>a)(?P=x)', False),
+    ('(a)?(?(1)b|c)', False),
+    ('(?i)abc', False),
+    ('(?x) a', False),
+])
+def test_combinable(pattern, combinable):
+    assert bank2qif._combinable(pattern) == combinable
+
+
+def test_bad_expression():
+    with pytest.raises(ValueError):
+        bank2qif.Categorizer([('re:(unclosed', 'Bad', None)])
+
+
+def test_categorize(tmp_path):
+    rules = tmp_path / 'rules.txt'
+    rules.write_text(u'# Groceries\n'
+                     u'albert\tFood\n'
+                     u're:\\d+/0800\tSavings\tSpořitelna\n', encoding='utf-8')
+    transactions = [
+        bank2qif.TransactionData(date(2023, 1, 1), -100,
+                                 destination='ALBERT HYPERMARKET'),
+        bank2qif.TransactionData(date(2023, 1, 2), 100,
+                                 message='Platba 1234/0800'),
+        bank2qif.TransactionData(date(2023, 1, 3), 100, message='Nájem'),
+    ]
+    categorizer = bank2qif.Categorizer.from_file(str(rules))
+    result = [(t.category, t.destination)
+              for t in categorizer.categorize(transactions)]
+    assert result == [('Food', 'ALBERT HYPERMARKET'),
+                      ('Savings', 'Spořitelna'), (None, None)]
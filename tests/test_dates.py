@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Tests of parsing dates of statements"""
+
+from datetime import date
+
+import pytest
+
+import bank2qif
+
+
+def test_parse_date():
+    assert bank2qif.parse_date('31.12.2014') == date(2014, 12, 31)
+    assert bank2qif.parse_date('2023-07-02', 'ymd', '-') == date(2023, 7, 2)
+    assert bank2qif.parse_date('020723', 'dmy', '') == date(2023, 7, 2)
+    for text in ('31.12', '32.12.2014', 'xx.12.2014'):
+        with pytest.raises(ValueError):
+            bank2qif.parse_date(text)
+
+
+@pytest.mark.parametrize('text, order, separator', [
+    ('29.02.2023', 'dmy', '.'),
+    ('2023-13-01', 'ymd', '-'),
+    ('3112', 'dmy', ''),
+    ('', 'dmy', '.'),
+])
+def test_parse_date_invalid(text, order, separator):
+    with pytest.raises(ValueError):
+        bank2qif.parse_date(text, order, separator)
+
+
+def test_parse_date_memoized():
+    bank2qif.parse_date.cache_clear()
+    for _ in range(3):
+        assert bank2qif.parse_date('29.02.2024') == date(2024, 2, 29)
+    assert bank2qif.parse_date.cache_info().hits == 2
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Tests of the index of converted transactions"""
+
+import os
+from datetime import date
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / 'seen.db')
+
+
+def dedup(index_path, transactions, **kwargs):
+    index = bank2qif.DedupIndex(index_path, **kwargs)
+    result = list(bank2qif.deduplicate(transactions, index))
+    index.close()
+    return result
+
+
+@pytest.mark.parametrize('source', ['fio', 'kb'])
+def test_overlapping_statements(index_path, source):
+    transactions = list(bank2qif.IMPORTERS[source](generate(source, 45)))
+    assert dedup(index_path, transactions[:30]) == transactions[:30]
+    assert dedup(index_path, transactions[15:]) == transactions[30:]
+    assert dedup(index_path, transactions) == []
+
+
+def test_repeated_transactions(index_path):
+    coffee = bank2qif.TransactionData(date(2023, 1, 1), -5000,
+                                      message='Kavárna U Čížka')
+    assert len(dedup(index_path, [coffee, coffee])) == 2
+    # Third coffee of the day is new
+    assert len(dedup(index_path, [coffee, coffee, coffee])) == 1
+
+
+def test_discard(index_path, monkeypatch):
+    monkeypatch.setattr(bank2qif.DedupIndex, 'flush_size', 10)
+    transactions = list(bank2qif.IMPORTERS['kb'](generate('kb', 45)))
+    dedup(index_path, transactions[:5])
+    index = bank2qif.DedupIndex(index_path)
+    assert len(list(bank2qif.deduplicate(transactions, index))) == 40
+    index.discard()
+    assert dedup(index_path, transactions) == transactions[5:]
+
+
+def test_bloom_filter_rebuilt(index_path):
+    transactions = list(bank2qif.IMPORTERS['kb'](generate('kb', 200)))
+    # Filter gets over its capacity
+    assert len(dedup(index_path, transactions, capacity=16)) == 200
+    assert dedup(index_path, transactions, capacity=16) == []
+    os.unlink(index_path + '.bloom')
+    assert dedup(index_path, transactions) == []
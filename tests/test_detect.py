@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Tests of automatic detection of statement types"""
+
+import io
+
+import pytest
+
+import bank2qif
+
+
+class Pipe(io.RawIOBase):
+    """Non-seekable stream like stdin"""
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._data.read(min(len(buffer), 100))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def test_detect(statement, qif):
+    source, path = statement
+    if bank2qif.IMPORTERS[source].get_signature() is None:
+        pytest.skip("%s statements have no signature" % (source,))
+    with open(path, 'rb') as infile:
+        content = infile.read()
+    expected = qif(bank2qif.IMPORTERS[source](content))
+    assert bank2qif.detect_importer(content) == (source, content)
+    assert bank2qif.detect_importer(path) == (source, path)
+    with open(path, 'rb') as infile:
+        detected, stream = bank2qif.detect_importer(infile)
+        assert detected == source
+        assert qif(bank2qif.IMPORTERS[source](stream)) == expected
+    # Sniffed data is put in front of the rest of the input again
+    detected, stream = bank2qif.detect_importer(Pipe(content),
+                                                sniff_size=1000)
+    assert detected == source
+    assert qif(bank2qif.IMPORTERS[source](stream)) == expected
+
+
+@pytest.mark.parametrize('data', [b'', b'Hello\nworld\n', b'\xff\xfe\x00'])
+def test_unknown(data):
+    with pytest.raises(ValueError):
+        bank2qif.detect_importer(data)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Tests of error policies, quarantine and resumed conversion"""
+
+import io
+import os
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+def corrupt(data, line_no):
+    """Returns statement with date of the record on line_no broken"""
+    lines = data.split(b'\r\n')
+    lines[line_no - 1] = b'xx' + lines[line_no - 1][2:]
+    return b'\r\n'.join(lines)
+
+
+@pytest.fixture
+def bad_mbank(tmp_path):
+    path = tmp_path / 'bad.mbank'
+    path.write_bytes(corrupt(generate('mbank', 45), 15))
+    return str(path)
+
+
+def test_strict(bad_mbank):
+    with pytest.raises(ValueError):
+        list(bank2qif.IMPORTERS['mbank'](bad_mbank))
+
+
+def test_skip(bad_mbank):
+    report = io.StringIO()
+    errors = bank2qif.ErrorPolicy('skip', report=report)
+    transactions = list(bank2qif.IMPORTERS['mbank'](bad_mbank,
+                                                    errors=errors))
+    assert len(transactions) == 44
+    assert errors.rejected == 1
+    assert report.getvalue().startswith('Rejected record on line 15: '
+                                        'ValueError')
+
+
+def test_quarantine(bad_mbank, tmp_path):
+    quarantine = str(tmp_path / 'out.rejected')
+    errors = bank2qif.ErrorPolicy('quarantine', quarantine,
+                                  report=io.StringIO())
+    list(bank2qif.IMPORTERS['mbank'](bad_mbank, errors=errors))
+    errors.close()
+    with open(quarantine, 'rb') as rejected:
+        lines = rejected.read().decode('utf-8').splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith('# line 15: ValueError')
+    assert lines[1].startswith('xx-')
+
+    # Nothing rejected, nothing left behind
+    errors = bank2qif.ErrorPolicy('quarantine', quarantine,
+                                  report=io.StringIO())
+    list(bank2qif.IMPORTERS['mbank'](generate('mbank', 45), errors=errors))
+    errors.close()
+    assert not os.path.exists(quarantine)
+
+
+def blank_amount(source, line_no, start, end):
+    """Returns statement with amount on line_no (columns start to end)
+    left out"""
+    encoding = bank2qif.IMPORTERS[source].input_encoding
+    lines = generate(source, 3).decode(encoding).split('\r\n')
+    line = lines[line_no - 1]
+    lines[line_no - 1] = line[:start] + ' ' * (end - start) + line[end:]
+    return '\r\n'.join(lines).encode(encoding)
+
+
+@pytest.mark.parametrize('source, data', [
+    ('mbank', generate('mbank', 3).replace(b';20 835,23;20 835,23;',
+                                           b';;20 835,23;')),
+    ('rb', blank_amount('rb', 11, 55, 76)),
+])
+def test_missing_amount(source, data):
+    with pytest.raises(ValueError):
+        list(bank2qif.IMPORTERS[source](data))
+    report = io.StringIO()
+    errors = bank2qif.ErrorPolicy('skip', report=report)
+    transactions = list(bank2qif.IMPORTERS[source](data, errors=errors))
+    assert len(transactions) == 2
+    assert 'ValueError: Missing amount' in report.getvalue()
+
+
+def test_split_amount():
+    with pytest.raises(ValueError):
+        bank2qif.SplitItem(None)
+    with pytest.raises(ValueError):
+        bank2qif.SplitItem(12.5)
+
+
+def convert(source, path, output, mode='strict'):
+    """Converts statement with checkpoints like --resume does"""
+    checkpoint = bank2qif.Checkpoint(output + '.checkpoint', path, source)
+    checkpoint.load()
+    errors = None
+    if mode != 'strict':
+        errors = bank2qif.ErrorPolicy(
+            mode, output + '.rejected', report=io.StringIO(),
+            quarantine_size=checkpoint.quarantine_size)
+        checkpoint.errors = errors
+    transactions = checkpoint.track(bank2qif.IMPORTERS[source](
+        path, errors=errors))
+    try:
+        with bank2qif.open_truncated(output, checkpoint.output_size) as out:
+            bank2qif.write_transactions(out, transactions,
+                                        checkpoint=checkpoint)
+    finally:
+        if errors is not None:
+            errors.close()
+    checkpoint.remove()
+    return checkpoint
+
+
+def interrupt(source, path, output, monkeypatch, mode='strict'):
+    """Runs conversion failing to write the third batch of ten"""
+    monkeypatch.setattr(bank2qif.Exporter, 'batch_size', 10)
+    render = bank2qif.QIFWriter.render
+    calls = []
+
+    def failing(self, transactions):
+        calls.append(len(transactions))
+        if len(calls) == 3:
+            raise IOError("Disk full")
+        return render(self, transactions)
+    monkeypatch.setattr(bank2qif.QIFWriter, 'render', failing)
+    with pytest.raises(IOError):
+        convert(source, path, output, mode)
+    monkeypatch.setattr(bank2qif.QIFWriter, 'render', render)
+    checkpoint = bank2qif.Checkpoint(output + '.checkpoint', path, source)
+    assert checkpoint.load()
+    return checkpoint
+
+
+def test_resume(statement, qif, tmp_path, monkeypatch):
+    source, path = statement
+    expected = qif(bank2qif.IMPORTERS[source](path))
+    output = str(tmp_path / 'statement.qif')
+    checkpoint = interrupt(source, path, output, monkeypatch)
+    # The third batch was never written
+    assert checkpoint.transactions == 20
+    assert checkpoint.output_size == os.path.getsize(output)
+
+    convert(source, path, output)
+    with open(output, 'rb') as result:
+        assert result.read() == expected
+    assert not os.path.exists(output + '.checkpoint')
+
+
+def test_resume_quarantine(bad_mbank, tmp_path, monkeypatch):
+    expected = str(tmp_path / 'expected.qif')
+    convert('mbank', bad_mbank, expected, 'quarantine')
+    output = str(tmp_path / 'statement.qif')
+    checkpoint = interrupt('mbank', bad_mbank, output, monkeypatch,
+                           'quarantine')
+    assert checkpoint.quarantine_size > 0
+    convert('mbank', bad_mbank, output, 'quarantine')
+    for suffix in ('', '.rejected'):
+        with open(output + suffix, 'rb') as result, \
+                open(expected + suffix, 'rb') as reference:
+            assert result.read() == reference.read()
+
+
+def test_incremental_quarantine(cli, tmp_path, bad_mbank):
+    process = cli('-t', 'mbank', '--incremental', 'state.json',
+                  '--on-error', 'quarantine', '-i', bad_mbank,
+                  '-o', 'out.qif')
+    assert process.returncode == 0, process.stderr
+    assert process.stderr.endswith('Rejected records: 1\n')
+    assert (tmp_path / 'out.qif.rejected').exists()
+
+    (tmp_path / 'good.mbank').write_bytes(generate('mbank', 45))
+    process = cli('-t', 'mbank', '--incremental', 'state2.json',
+                  '--on-error', 'quarantine', '-i', 'good.mbank',
+                  '-o', 'good.qif')
+    assert process.returncode == 0, process.stderr
+    assert process.stderr == ''
+    # Nothing rejected, nothing left behind
+    assert not (tmp_path / 'good.qif.rejected').exists()
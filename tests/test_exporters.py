@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Tests of the output formats"""
+
+import io
+import re
+from datetime import date
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+def ofx(transactions, statement):
+    out = bytearray()
+    bank2qif.write_transactions(out, transactions, output_format='ofx',
+                                statement=statement)
+    return out.decode('utf-8')
+
+
+@pytest.mark.parametrize('source, currency', [
+    ('fio', 'CZK'), ('kb', 'CZK'), ('zuno', 'EUR'), ('slsp', 'EUR'),
+])
+def test_ofx_currency(source, currency):
+    data = generate(source, 10)
+    importer = bank2qif.IMPORTERS[source](data)
+    for statement in (importer, bank2qif.IMPORTERS[source]):
+        output = ofx(bank2qif.IMPORTERS[source](data), statement)
+        assert '<CURDEF>%s</CURDEF>' % currency in output
+
+
+def test_ofx_ledger_balance(monkeypatch):
+    report = io.StringIO()
+    monkeypatch.setattr(bank2qif.OFXExporter, 'report', report)
+    data = generate('fio', 10)
+    importer = bank2qif.IMPORTERS['fio'](data)
+    output = ofx(importer, importer)
+    balance = re.search('<BALAMT>(.*)</BALAMT>', output).group(1)
+    assert balance == bank2qif.format_amount(importer.closing_balance)
+    assert report.getvalue() == ''
+
+    # Statement class knows no balances
+    importer_class = bank2qif.IMPORTERS['fio']
+    output = ofx(importer_class(data), importer_class)
+    assert '<BALAMT>0.00</BALAMT>' in output
+    assert 'placeholder' in report.getvalue()
+
+
+@pytest.fixture
+def transactions(statement):
+    source, path = statement
+    return list(bank2qif.IMPORTERS[source](path))
+
+
+def export(transactions, output_format, **kwargs):
+    out = bytearray()
+    with bank2qif.EXPORTERS[output_format](out, **kwargs) as writer:
+        writer.write_all(transactions)
+    return bytes(out)
+
+
+def test_csv(transactions):
+    import csv
+    rows = list(csv.reader(io.StringIO(
+        export(transactions, 'csv', batch_size=7).decode('utf-8'))))
+    assert rows[0] == list(bank2qif.CSVExporter.columns)
+    assert rows[1:] == [[bank2qif.format_date(t.date),
+                         bank2qif.format_amount(t.get_amount()),
+                         t.ident or '', t.destination or '', t.message or '',
+                         '']
+                        for t in transactions]
+
+
+def test_jsonl(transactions):
+    import json
+    lines = export(transactions, 'jsonl', batch_size=7).decode(
+        'utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [(r['date'], r['amount'], r['ident'], r['destination'],
+             r['message']) for r in records] == \
+        [(bank2qif.format_date(t.date), bank2qif.format_amount(t.get_amount()),
+          t.ident, t.destination, t.message) for t in transactions]
+    for record, transaction in zip(records, transactions):
+        if len(transaction.splits) > 1:
+            assert [s['amount'] for s in record['splits']] == \
+                [bank2qif.format_amount(s.amount) for s in transaction.splits]
+        else:
+            assert 'splits' not in record
+
+
+def test_ofx(transactions, monkeypatch):
+    monkeypatch.setattr(bank2qif.OFXExporter, 'report', io.StringIO())
+    output = export(transactions, 'ofx', batch_size=7).decode('utf-8')
+    assert output.count('<STMTTRN>') == len(transactions)
+    fitids = re.findall('<FITID>(.*?)</FITID>', output)
+    assert len(set(fitids)) == len(fitids)
+    assert re.findall('<TRNAMT>(.*?)</TRNAMT>', output) == \
+        [bank2qif.format_amount(t.get_amount()) for t in transactions]
+    first = min(t.date for t in transactions).strftime('%Y%m%d')
+    assert '<DTSTART>%s</DTSTART>' % first in output
+    # The same statement gets the same identifiers again
+    assert re.findall('<FITID>(.*?)</FITID>', export(
+        transactions, 'ofx').decode('utf-8')) == fitids
+
+
+def test_ofx_escape():
+    transaction = bank2qif.TransactionData(date(2023, 1, 1), 100,
+                                           destination='A&B <s.r.o.>')
+    output = export([transaction], 'ofx', batch_size=7).decode('utf-8')
+    assert '<NAME>A&amp;B &lt;s.r.o.&gt;</NAME>' in output
+
+
+def no_pyarrow(init):
+    def wrapped(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        self.pyarrow = None
+    return wrapped
+
+
+def test_columns(transactions, monkeypatch):
+    monkeypatch.setattr(bank2qif.ColumnExporter, '__init__',
+                        no_pyarrow(bank2qif.ColumnExporter.__init__))
+    columns = bank2qif.read_columns(export(transactions, 'columns',
+                                           batch_size=7))
+    assert columns['date'] == [t.date for t in transactions]
+    assert list(columns['amount']) == [t.get_amount() for t in transactions]
+    for name in ('ident', 'destination', 'message'):
+        assert columns[name] == [getattr(t, name) or ''
+                                 for t in transactions]
+
+
+def test_columns_arrow(transactions):
+    pyarrow = pytest.importorskip('pyarrow')
+    table = pyarrow.ipc.open_stream(export(transactions, 'columns',
+                                           batch_size=7)).read_all()
+    assert table.column('date').to_pylist() == [t.date for t in transactions]
+    assert table.column('amount').to_pylist() == \
+        [t.get_amount() for t in transactions]
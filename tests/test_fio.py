@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Tests of decoding Fio GPC records"""
+
+from datetime import date
+
+import pytest
+
+import bank2qif
+
+
+FIO_STATEMENT = (
+    b'0740000002000000001Jan Novak           31122200000000000000+'
+    b'00000000000523+000000000000000000000000000000001311223'
+    b'              \r\n'
+    b'0750000002000000001000000000544372100000010000000000000012342'
+    b'000857776600000008000000000000010123Platba za elektrinu 00203010123'
+    b'\r\n'
+    b'0750000002000000001000000000000000000000010000010000000007111'
+    b'000978752600000000000000000000020723Najem               00203020723'
+    b'\r\n')
+
+
+def test_fio_records():
+    importer = bank2qif.IMPORTERS['fio'](FIO_STATEMENT)
+    credit, debit = list(importer)
+    assert credit.date == date(2023, 1, 1)
+    assert credit.amount == 1234
+    assert credit.destination == '5443721/800'
+    assert credit.message == 'Platba za elektrinu'
+    assert credit.ident == '0000001000000'
+    assert debit.date == date(2023, 7, 2)
+    assert debit.amount == -711
+    assert debit.destination is None
+    assert debit.message == 'Najem'
+    assert importer.opening_balance == 0
+    assert importer.closing_balance == 523
+
+
+def test_fio_bad_record():
+    # Amount isn't a number
+    data = FIO_STATEMENT.replace(b'00000000012342', b'000000000x2342')
+    with pytest.raises(ValueError):
+        list(bank2qif.IMPORTERS['fio'](data))
+
+
+@pytest.mark.parametrize('line', [
+    # Unknown record type
+    b'076' + FIO_STATEMENT.split(b'\r\n')[1][3:],
+    # Record cut short
+    FIO_STATEMENT.split(b'\r\n')[1][:100],
+])
+def test_fio_bad_record_type(line):
+    data = FIO_STATEMENT + line + b'\r\n'
+    with pytest.raises(bank2qif.BadRecordTypeException):
+        list(bank2qif.IMPORTERS['fio'](data))
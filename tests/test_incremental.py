@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Tests of incremental conversion and watermarks"""
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+def growing(source):
+    """Returns the statement cut after 30 records and the whole one"""
+    prefix, records = bank2qif.IMPORTERS[source].split_records(
+        generate(source, 45))
+    return (prefix + b''.join(records[:30]), prefix + b''.join(records))
+
+
+@pytest.fixture(params=sorted(source for source in bank2qif.IMPORTERS
+                              if source != 'mbank-html'))
+def source(request):
+    return request.param
+
+
+def test_growing_statement(source, qif):
+    head, whole = growing(source)
+    importer = bank2qif.IMPORTERS[source]
+    first, watermark = bank2qif.incremental_transactions(head, source)
+    assert qif(first) == qif(importer(head))
+    assert watermark['type'] == source
+    assert watermark['last_ident'] == first[-1].ident
+
+    second, watermark = bank2qif.incremental_transactions(whole, source,
+                                                          watermark)
+    assert len(second) == len(list(importer(whole))) - len(first)
+    assert qif(first + second) == qif(importer(whole))
+
+    # Nothing added, last converted transaction is kept
+    third, unchanged = bank2qif.incremental_transactions(whole, source,
+                                                         watermark)
+    assert third == []
+    assert unchanged == watermark
+
+
+def test_changed_statement(qif):
+    prefix, records = bank2qif.IMPORTERS['mbank'].split_records(
+        generate('mbank', 45))
+    _, watermark = bank2qif.incremental_transactions(
+        prefix + b''.join(records[:30]), 'mbank')
+    # Description of the first converted record was edited
+    records[0] = records[0].replace(b';"', b';"X', 1)
+    changed = prefix + b''.join(records)
+    transactions, _ = bank2qif.incremental_transactions(changed, 'mbank',
+                                                        watermark)
+    assert len(transactions) == 45
+    assert qif(transactions) == qif(bank2qif.IMPORTERS['mbank'](changed))
+
+
+def test_other_type(qif):
+    head, whole = growing('fio')
+    _, watermark = bank2qif.incremental_transactions(head, 'fio')
+    watermark['type'] = 'mbank'
+    transactions, _ = bank2qif.incremental_transactions(whole, 'fio',
+                                                        watermark)
+    assert qif(transactions) == qif(bank2qif.IMPORTERS['fio'](whole))
+
+
+def test_not_splittable():
+    with pytest.raises(ValueError):
+        bank2qif.incremental_transactions(generate('mbank-html', 10),
+                                          'mbank-html')
+
+
+def test_store(tmp_path):
+    path = str(tmp_path / 'state.json')
+    store = bank2qif.WatermarkStore(path)
+    assert store.get('account') is None
+    _, watermark = bank2qif.incremental_transactions(generate('kb', 10),
+                                                     'kb')
+    store.set('account', watermark)
+    store.save()
+    assert bank2qif.WatermarkStore(path).get('account') == watermark
+    assert [p.name for p in tmp_path.iterdir()] == ['state.json']
+
+
+def test_cli(cli, tmp_path):
+    head, whole = growing('mbank')
+    statement = tmp_path / 'statement.mbank'
+    statement.write_bytes(head)
+    done = cli('--incremental', 'state.json', '-t', 'mbank',
+               '-o', 'first.qif', '-i', 'statement.mbank')
+    assert done.returncode == 0, done.stderr
+    statement.write_bytes(whole)
+    done = cli('--incremental', 'state.json', '-t', 'mbank',
+               '-o', 'second.qif', '-i', 'statement.mbank')
+    assert done.returncode == 0, done.stderr
+
+    first = (tmp_path / 'first.qif').read_bytes()
+    second = (tmp_path / 'second.qif').read_bytes()
+    everything = bytearray()
+    bank2qif.write_transactions(everything,
+                                bank2qif.IMPORTERS['mbank'](whole))
+    assert first.count(b'\n^') == 30
+    header = b'!Type:Bank\n'
+    assert second.startswith(header)
+    assert first + second[len(header):] == bytes(everything)
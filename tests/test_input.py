@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Tests of reading statements from paths, bytes and open files"""
+
+import io
+
+import bank2qif
+
+
+def test_input_sources(statement, qif):
+    source, path = statement
+    with open(path, 'rb') as infile:
+        content = infile.read()
+    expected = qif(bank2qif.IMPORTERS[source](path))
+    assert expected.count(b'\n^\n') == 45
+    assert qif(bank2qif.IMPORTERS[source](content)) == expected
+    assert qif(bank2qif.IMPORTERS[source](io.BytesIO(content))) == expected
+    with open(path, 'rb') as infile:
+        assert qif(bank2qif.IMPORTERS[source](infile)) == expected
+
+
+def test_input_opened_once(statement, monkeypatch):
+    source, path = statement
+    opened = []
+    real_open = open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args[0])
+        return real_open(*args, **kwargs)
+    monkeypatch.setattr('builtins.open', counting_open)
+    list(bank2qif.IMPORTERS[source](path))
+    assert opened == [path]
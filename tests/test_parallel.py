@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""Tests of parsing a statement in parallel chunks"""
+
+import pytest
+
+import bank2qif
+
+
+@pytest.mark.parametrize('processes, chunk_records', [(1, 7), (2, 10),
+                                                      (2, None)])
+def test_parse_in_chunks(statement, qif, processes, chunk_records):
+    source, path = statement
+    with open(path, 'rb') as infile:
+        content = infile.read()
+    expected = qif(bank2qif.IMPORTERS[source](content))
+    assert qif(bank2qif.parse_in_chunks(source, content, processes,
+                                        chunk_records)) == expected
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Tests of QIFWriter and its sinks"""
+
+import io
+from datetime import date
+
+import bank2qif
+from generators import generate
+
+
+def test_mbank_qif():
+    out = bytearray()
+    bank2qif.write_transactions(out, bank2qif.IMPORTERS['mbank'](
+        generate('mbank', 2)))
+    assert out.decode('utf-8') == (
+        u'!Type:Bank\n'
+        u'D1/1/2023\nT20835.23\n'
+        u'MPLATBA KARTOU  Lékárna Dr. Max 5443721/0800\n^\n'
+        u'D7/2/2023\nT-9237.44\n'
+        u'MPLATBA KARTOU Příspěvek na dovolenou Lékárna Dr. Max '
+        u'63977760/0800\n^\n')
+
+
+def split_transaction():
+    transaction = bank2qif.TransactionData(date(2023, 7, 2), None,
+                                           destination='Albert',
+                                           message='Nákup', ident='42')
+    transaction.add_split(bank2qif.SplitItem(-10050, 'Jídlo'))
+    transaction.add_split(bank2qif.SplitItem(-1999))
+    transaction.category = 'Potraviny'
+    return transaction
+
+
+def test_splits():
+    out = bytearray()
+    bank2qif.write_transactions(out, [split_transaction()])
+    assert out.decode('utf-8') == (
+        u'!Type:Bank\n'
+        u'D7/2/2023\nT-120.49\n#42\nMNákup\nPAlbert\nLPotraviny\n'
+        u'EJídlo\n$-100.50\n$-19.99\n^\n')
+
+
+def test_sinks(tmp_path):
+    transactions = [split_transaction()] * 5
+    expected = bytearray()
+    bank2qif.write_transactions(expected, transactions)
+    path = str(tmp_path / 'out.qif')
+    bank2qif.write_transactions(path, transactions)
+    with open(path, 'rb') as result:
+        assert result.read() == expected
+    binary = io.BytesIO()
+    with bank2qif.QIFWriter(binary, batch_size=2) as writer:
+        for transaction in transactions:
+            writer.write(transaction)
+    assert binary.getvalue() == expected
+    text = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+    with bank2qif.QIFWriter(text, batch_size=3) as writer:
+        writer.write_all(transactions)
+    assert text.buffer.getvalue() == expected
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Tests of reconciliation with statement balances"""
+
+import io
+from datetime import date
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+def reconcile(source, data, strict=False):
+    reconciliation = bank2qif.Reconciliation(
+        bank2qif.IMPORTERS[source](data), strict, io.StringIO())
+    count = len(list(reconciliation))
+    return count, reconciliation.problems
+
+
+def tamper(data, line_no):
+    """Returns Fio statement with amount on line_no raised by 0.01"""
+    lines = data.split(b'\r\n')
+    line = lines[line_no - 1]
+    amount = b'%012d' % (int(line[48:60]) + 1)
+    lines[line_no - 1] = line[:48] + amount + line[60:]
+    return b'\r\n'.join(lines)
+
+
+@pytest.mark.parametrize('source', ['fio', 'mbank'])
+def test_balanced(source):
+    assert reconcile(source, generate(source, 45), True) == (45, [])
+
+
+def test_unbalanced():
+    data = tamper(generate('fio', 45), 5)
+    with pytest.raises(bank2qif.ReconciliationError) as error:
+        reconcile('fio', data, True)
+    assert str(error.value).startswith('Opening balance 0.00 and 45 '
+                                       'transactions')
+    count, problems = reconcile('fio', data)
+    assert count == 45 and len(problems) == 1
+
+
+def test_balances_not_found():
+    assert reconcile('kb', generate('kb', 45)) == \
+        (45, ['Balances not found in the statement'])
+
+
+def test_concatenated_statements():
+    data = generate('fio', 45) + generate('fio', 30, seed=1)
+    assert reconcile('fio', data, True) == (75, [])
+    # Second statement starts on line 47
+    count, problems = reconcile('fio', tamper(data, 50))
+    assert count == 75
+    assert len(problems) == 1
+    assert problems[0].startswith('Statement 2: Opening balance')
+    # Statement without transactions
+    assert reconcile('fio', data + generate('fio', 0, seed=2), True) == \
+        (75, [])
+
+
+def test_splits_add_up():
+    transaction = bank2qif.TransactionData(date(2023, 1, 1), -1000)
+    transaction.add_split(bank2qif.SplitItem(-900))
+    transaction.add_split(bank2qif.SplitItem(-99))
+
+    class Statement(list):
+        statement_no = 1
+        opening_balance = 0
+        closing_balance = -999
+    reconciliation = bank2qif.Reconciliation(Statement([transaction]),
+                                             False, io.StringIO())
+    list(reconciliation)
+    assert reconciliation.problems == [
+        "Splits of transaction 1 don't add up to -10.00"]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Tests of the conversion service"""
+
+import asyncio
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+def serve(tmp_path, client, jobs=2, **kwargs):
+    """Runs coroutine function client(address) against a running server"""
+    address = str(tmp_path / 'service.sock')
+
+    async def run():
+        server = bank2qif.ConversionServer(jobs=jobs, **kwargs)
+        listening = await server.start(address)
+        try:
+            return await client(address)
+        finally:
+            listening.close()
+            await listening.wait_closed()
+            server.executor.shutdown()
+    return asyncio.run(run())
+
+
+async def request(address, header, data=b''):
+    reader, writer = await asyncio.open_unix_connection(address)
+    writer.write(header + data)
+    writer.write_eof()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+@pytest.mark.parametrize('source', ['mbank', 'fio', 'auto'])
+def test_convert(tmp_path, qif, source):
+    data = generate('fio' if source == 'auto' else source, 300)
+    expected = qif(bank2qif.IMPORTERS[source if source != 'auto' else 'fio'](
+        data))
+
+    async def client(address):
+        header = ('%s %d\n' % (source, len(data))).encode('ascii')
+        return await request(address, header, data)
+    assert serve(tmp_path, client) == expected
+
+
+@pytest.mark.parametrize('header, error', [
+    (b'mbank\n', b'!Error: Bad request header'),
+    (b'nobank 10\n', b"!Error: Unknown type 'nobank'"),
+    (b'mbank 1000\n', b'!Error: Statement larger than 100 bytes'),
+    (b'mbank 50\n', b'!Error: 0 bytes read on a total of 50 expected'),
+])
+def test_bad_request(tmp_path, header, error):
+    async def client(address):
+        return await request(address, header)
+    assert serve(tmp_path, client, max_size=100).startswith(error)
+
+
+def test_conversion_error(tmp_path):
+    data = b'074 not a statement\n075 nor a record\n'
+
+    async def client(address):
+        return await request(address, b'fio %d\n' % len(data), data)
+    response = serve(tmp_path, client)
+    assert response.startswith(b'!Type:Bank\n!Error: BadRecordTypeException')
+
+
+def test_waiting_clients_not_read(tmp_path, qif, monkeypatch):
+    data = generate('kb', 100)
+    expected = qif(bank2qif.IMPORTERS['kb'](data))
+    header = b'kb %d\n' % len(data)
+    reads = []
+    readexactly = asyncio.StreamReader.readexactly
+
+    async def counting(self, length):
+        reads.append(length)
+        return await readexactly(self, length)
+    monkeypatch.setattr(asyncio.StreamReader, 'readexactly', counting)
+
+    async def client(address):
+        # First client holds the only slot while sending its statement
+        reader, writer = await asyncio.open_unix_connection(address)
+        writer.write(header + data[:100])
+        await writer.drain()
+        second = asyncio.ensure_future(request(address, header, data))
+        await asyncio.sleep(0.2)
+        assert reads == [len(data)]
+        writer.write(data[100:])
+        first = await reader.read()
+        writer.close()
+        return first, await second
+    assert serve(tmp_path, client, jobs=1) == (expected, expected)
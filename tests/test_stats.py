@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Tests of conversion stats"""
+
+import io
+
+import pytest
+
+import bank2qif
+from generators import generate
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_stages_add_up(tmp_path, cached):
+    cache = None
+    if cached:
+        cache = bank2qif.ParseCache(str(tmp_path / 'cache'))
+    stats = bank2qif.Stats()
+    transactions = bank2qif.load_transactions(generate('kb', 2000), 'kb',
+                                              cache, stats)
+    bank2qif.write_transactions(bytearray(), transactions, stats)
+    data = stats.as_dict()
+    assert data['counters']['transactions'] == 2000
+    assert data['total'] > 0
+    # Time is credited to one stage at a time
+    assert sum(data['stages'].values()) == pytest.approx(data['total'],
+                                                         rel=0.01)
+    assert 'fields' in data['stages'] and 'write' in data['stages']
+
+
+def test_report():
+    stats = bank2qif.Stats()
+    bank2qif.write_transactions(bytearray(), bank2qif.IMPORTERS['fio'](
+        generate('fio', 100), stats=stats), stats)
+    report = io.StringIO()
+    stats.report(report)
+    lines = report.getvalue().splitlines()
+    assert lines[0].startswith('Total time: ')
+    assert any(line.split()[:2] == ['transactions', '100'] for line in lines)